@@ -0,0 +1,296 @@
+import struct
+from collections import Counter
+from bitarray import bitarray
+from Huffman import BuildCodeLengths, CanonicalCodes, MAX_CODE_LENGTH, CHUNK_SIZE
+from HuffmanDecoder import DecodeTable
+
+#One pass (adaptive) Huffman coding for streams that cannot be read twice
+#Compress counts every file before encoding it, which rules out pipes and sockets
+#Here both sides start from the same flat counts over the 256 byte values plus an
+#end of stream symbol, encode (or decode) a run of symbols with the current canonical
+#code, then add that run to the counts and rebuild the code. The decoder sees exactly
+#the same symbols in the same runs, so it always rebuilds the same code as the encoder
+#and no table is ever stored
+#The runs start short so the code adapts quickly and double up to MAX_INTERVAL,
+#counts are halved once they add up to more than COUNT_LIMIT so old data fades out
+#The layout of a stream is
+    #Header  -> magic and version
+    #Payload -> the packed codes of every byte, then the end of stream code padded to a whole byte
+
+STREAM_MAGIC = b"HUFS"
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct(">4sB")   #magic, version
+
+ALPHABET_SIZE = 257     #The byte values and the end of stream symbol
+EOF_SYMBOL = 256
+FIRST_INTERVAL = 256    #Symbols coded before the first rebuild
+MAX_INTERVAL = 1 << 16  #Most symbols coded between rebuilds
+COUNT_LIMIT = 1 << 20   #Counts are halved when their total goes over this
+
+#The decoder works on text with one character per symbol so it can use DecodeTable
+#Bytes are characters 0 to 255 (latin-1) and the end of stream symbol is character 256
+EOF_CHAR = chr(EOF_SYMBOL)
+
+class AdaptiveModel:
+    #This class holds the symbol counts and code both sides keep in step
+    #Each model has
+        #counts -> the count of every symbol, never below 1 so every symbol has a code
+        #pending -> counts of the current run, added to counts at the next rebuild
+        #interval -> the length of the current run
+        #left -> how many more symbols are coded before the next rebuild
+        #codeLengths -> the current {symbol: code length}
+        #codeTable -> the current {symbol: code}
+    def __init__(self, maxCodeLength=MAX_CODE_LENGTH):
+        self.maxCodeLength = maxCodeLength
+        self.counts = [1] * ALPHABET_SIZE
+        self.pending = Counter()
+        self.interval = FIRST_INTERVAL
+        self.left = FIRST_INTERVAL
+        self.codeLengths = None
+        self.codeTable = None
+        self.Rebuild()
+
+    def Rebuild(self):
+        self.codeLengths = BuildCodeLengths(dict(enumerate(self.counts)), self.maxCodeLength)
+        self.codeTable = CanonicalCodes(self.codeLengths)
+
+    def Count(self, symbols):
+        #Counts symbols (byte values) that were just coded
+        self.pending.update(symbols)
+        self.left -= len(symbols)
+
+    def Update(self):
+        #Adds the finished run to the counts and rebuilds the code
+        for symbol, count in self.pending.items():
+            self.counts[symbol] += count
+        self.pending.clear()
+        if sum(self.counts) > COUNT_LIMIT:
+            self.counts = [(count + 1) // 2 for count in self.counts]
+        self.interval = min(self.interval * 2, MAX_INTERVAL)
+        self.left = self.interval
+        self.Rebuild()
+
+class AdaptiveCompressor:
+    #This class compresses a stream of bytes as it arrives
+    #Usage:
+        #compressor = AdaptiveCompressor()
+        #out.write(compressor.Feed(data)) as many times as needed
+        #out.write(compressor.Flush()) once at the end
+    def __init__(self, maxCodeLength=MAX_CODE_LENGTH):
+        self.model = AdaptiveModel(maxCodeLength)
+        self.encodeTable = self.BuildEncodeTable()
+        self.pending = bitarray()   #Bits that do not fill a whole byte yet
+        self.header = STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION)
+        self.finished = False
+
+    def BuildEncodeTable(self):
+        return {symbol: bitarray(code) for symbol, code in self.model.codeTable.items()}
+
+    def TakeBytes(self):
+        #Returns the header (the first time) and every whole byte encoded so far
+        wholeBits = len(self.pending) & ~7
+        data = self.header + self.pending[:wholeBits].tobytes()
+        del self.pending[:wholeBits]
+        self.header = b""
+        return data
+
+    def Feed(self, data):
+        #Encodes data (any bytes-like object) and returns the compressed bytes ready so far
+        if self.finished:
+            raise ValueError("Cannot feed a compressor after Flush")
+        data = memoryview(data).cast("B")
+        position = 0
+        while position < len(data):
+            run = data[position:position + self.model.left]
+            self.pending.encode(self.encodeTable, run)
+            self.model.Count(run)
+            position += len(run)
+            if self.model.left == 0:
+                self.model.Update()
+                self.encodeTable = self.BuildEncodeTable()
+        return self.TakeBytes()
+
+    def Flush(self):
+        #Ends the stream and returns the rest of the compressed bytes
+        if self.finished:
+            return b""
+        self.finished = True
+        self.pending += self.encodeTable[EOF_SYMBOL]
+        self.pending.fill()
+        return self.TakeBytes()
+
+class AdaptiveDecompressor:
+    #This class decompresses a stream made by AdaptiveCompressor as it arrives
+    #Usage:
+        #decompressor = AdaptiveDecompressor()
+        #out.write(decompressor.Feed(data)) as many times as needed
+        #out.write(decompressor.Flush()) once the input runs out
+    #Anything after the end of the stream is kept in unusedData
+    def __init__(self, maxCodeLength=MAX_CODE_LENGTH):
+        self.model = AdaptiveModel(maxCodeLength)
+        self.decodeTable = self.BuildDecodeTable()
+        self.buffer = bytearray()   #Input that has not been decoded yet
+        self.position = 0
+        self.acc = 0                #Bit accumulator, the unread bits are the low accBits bits
+        self.accBits = 0
+        self.headerRead = False
+        self.eof = False
+        self.unusedData = b""
+
+    def BuildDecodeTable(self):
+        return DecodeTable({chr(symbol): code for symbol, code in self.model.codeTable.items()})
+
+    def Feed(self, data):
+        #Decodes as much of the stream as possible and returns the bytes decoded so far
+        if self.eof:
+            self.unusedData += bytes(data)
+            return b""
+        self.buffer += data
+        return self.Decode(False)
+
+    def Flush(self):
+        #Decodes whatever is left, raises if the stream ended early
+        if self.eof:
+            return b""
+        data = self.Decode(True)
+        if not self.eof:
+            raise ValueError("Stream ended before its end marker")
+        return data
+
+    def ReadHeader(self):
+        if len(self.buffer) < STREAM_HEADER.size:
+            return False
+        magic, version = STREAM_HEADER.unpack_from(self.buffer)
+        if magic != STREAM_MAGIC:
+            raise ValueError("Not an adaptive Huffman stream")
+        if version != STREAM_VERSION:
+            raise ValueError(f"Unsupported stream version {version}")
+        self.position = STREAM_HEADER.size
+        self.headerRead = True
+        return True
+
+    def Decode(self, final):
+        #Decodes symbols while every code is known to be complete
+        #(or until the end marker once the input is final)
+        if not self.headerRead and not self.ReadHeader():
+            if final:
+                raise ValueError("Stream ended before its end marker")
+            return b""
+
+        model = self.model
+        table = self.decodeTable
+        tableBits = table.bits
+        mask = (1 << tableBits) - 1
+        need = max(tableBits, table.maxLength)
+        refillBytes = need // 8 + 8
+        buffer = self.buffer
+        position = self.position
+        acc = self.acc
+        accBits = self.accBits
+        left = model.left
+        output = []
+        run = []    #Text decoded since the last rebuild (or the start of this call)
+
+        while True:
+            if accBits < need and position < len(buffer):
+                chunk = buffer[position:position + refillBytes]
+                position += len(chunk)
+                acc = ((acc & ((1 << accBits) - 1)) << (8 * len(chunk))) | int.from_bytes(chunk, "big")
+                accBits += 8 * len(chunk)
+                continue
+            if accBits < need and not final:
+                break
+            if accBits == 0:
+                break
+
+            if accBits >= tableBits:
+                window = (acc >> (accBits - tableBits)) & mask
+            else:
+                window = (acc << (tableBits - accBits)) & mask
+
+            if accBits >= tableBits and left >= tableBits:
+                #A window holds at most tableBits codes so this cannot run past a rebuild
+                text, used = table.multi[window]
+                if not used:
+                    text, used = table.DecodeLong(acc, accBits, accBits)
+            else:
+                text, used = table.single[window]
+                if text is None or used > accBits:
+                    text, used = table.DecodeLong(acc, accBits, accBits)
+
+            if EOF_CHAR in text:
+                #Only count the bits up to the end marker, the rest of its byte is padding
+                text = text[:text.index(EOF_CHAR) + 1]
+                used = sum(model.codeLengths[ord(char)] for char in text)
+                accBits -= used
+                run.append(text[:-1])
+                self.eof = True
+                break
+
+            accBits -= used
+            left -= len(text)
+            run.append(text)
+            if left == 0:
+                data = "".join(run).encode("latin-1")
+                output.append(data)
+                run = []
+                model.Count(data)
+                model.Update()
+                left = model.left
+                self.decodeTable = table = self.BuildDecodeTable()
+                need = max(tableBits, table.maxLength)
+                refillBytes = need // 8 + 8
+
+        data = "".join(run).encode("latin-1")
+        output.append(data)
+        if not self.eof:
+            model.Count(data)
+
+        if self.eof:
+            #Whole bytes still in the accumulator belong to whatever follows the stream
+            wholeBytes = accBits // 8
+            self.unusedData = (acc & ((1 << (8 * wholeBytes)) - 1)).to_bytes(wholeBytes, "big") + bytes(buffer[position:])
+            self.buffer = bytearray()
+            self.position = 0
+        else:
+            del buffer[:position]
+            self.position = 0
+        self.acc = acc
+        self.accBits = accBits
+        return b"".join(output)
+
+def ReadSome(infile, size):
+    #Reads up to size bytes, returning whatever has arrived rather than waiting for all of them
+    #read() on a pipe or socket blocks until size bytes are there (or the end),
+    #read1() makes at most one read of the underlying stream
+    read1 = getattr(infile, "read1", None)
+    return read1(size) if read1 is not None else infile.read(size)
+
+def WriteNow(outfile, data):
+    #Writes data and flushes it so whoever reads the other end gets it straight away
+    if data:
+        outfile.write(data)
+        if hasattr(outfile, "flush"):
+            outfile.flush()
+
+def CompressStream(infile, outfile, chunkSize=CHUNK_SIZE):
+    #Compresses everything read from infile to outfile in one pass
+    #Both are binary file objects, so pipes like sys.stdin.buffer work
+    #Data is coded as it arrives, so a slow pipe is passed on a piece at a time
+    compressor = AdaptiveCompressor()
+    while True:
+        data = ReadSome(infile, chunkSize)
+        if not data:
+            break
+        WriteNow(outfile, compressor.Feed(data))
+    WriteNow(outfile, compressor.Flush())
+
+def DecompressStream(infile, outfile, chunkSize=CHUNK_SIZE):
+    #Decompresses a stream made by CompressStream from infile to outfile
+    decompressor = AdaptiveDecompressor()
+    while not decompressor.eof:
+        data = ReadSome(infile, chunkSize)
+        if not data:
+            break
+        WriteNow(outfile, decompressor.Feed(data))
+    WriteNow(outfile, decompressor.Flush())
@@ -0,0 +1,433 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from bitarray import bitarray
+from Huffman import (CountFrequency, BuildHuffmanTree, GenerateHuffmanCodes, BuildEncoder, Compress, Decompress,
+                     CountFileFrequency, MergeFrequency, BuildCodeLengths, CanonicalCodes, TrainDictionary, MODES)
+from HuffmanTree import BuildTree
+from HuffmanNumpy import CountFrequencyNumpy
+import HuffmanNumpy
+from HuffmanDecoder import DecodeTable, DecodeBits
+
+#Benchmarks for the compression tool
+#Run with: python Benchmark.py [--suite quick|full] [--json results.json]
+#The suite runs Compress and Decompress on generated corpora and the sample texts
+#for every backend, mode and variant, each case in a fresh process so peak memory is its own
+#The variants (see VARIANTS) cover the options that take other code paths: worker
+#processes, blocks, the order-1 model, per file tables and dictionaries
+#--variants picks some of them, e.g. --variants default,blocks
+#python Benchmark.py --micro runs the smaller decoder, backend and order benchmarks
+
+try:
+    import resource
+except ImportError:
+    resource = None #Not on Windows, peak memory is reported as null
+
+SAMPLE_DIR = "inputTexts"
+RESULTS_VERSION = 2 #Bumped whenever the fields of a JSON result change
+PARALLEL_WORKERS = max(2, min(4, os.cpu_count() or 1)) #Workers of the parallel variants
+#Options given to Compress in each variant, Decompress gets the same workers
+#"dictionary" trains a dictionary on the corpus itself and compresses with it
+VARIANTS = {
+    "default": {},
+    "parallel": {"workers": PARALLEL_WORKERS},
+    "blocks": {"workers": PARALLEL_WORKERS, "blockSize": 1 << 18},
+    "order1": {"order": 1},
+    "auto-tables": {"tables": "auto"},
+    "dictionary": {"dictionary": True},
+}
+SIZE_UNITS = {"KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30}
+TREE_ALPHABETS = (2, 16, 256, 4096, 65536, 1 << 20)
+
+def LoadSampleText(targetChars):
+    #Reads the sample texts and repeats them until we have
+    #at least targetChars characters to work with
+    text = ""
+    for filepath in sorted(glob.glob(os.path.join(SAMPLE_DIR, "*.txt"))):
+        with open(filepath, "r", encoding="utf-8") as infile:
+            text += infile.read()
+    if not text:
+        raise FileNotFoundError(f"No sample texts found in {SAMPLE_DIR}")
+    repeats = targetChars // len(text) + 1
+    return text * repeats
+
+def TimeIt(func, repeat=3):
+    #Runs func repeat times and returns the best time in seconds and the last result
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+def LegacyDecode(encodedBits, codeTable):
+    #The original per-bit decoder from Decompress, kept here for comparison
+    reverseCodeTable = {code: char for char, code in codeTable.items()}
+    decodedText = ""
+    currentCode = ""
+    for bit in encodedBits.to01():
+        currentCode += bit
+        if currentCode in reverseCodeTable:
+            decodedText += reverseCodeTable[currentCode]
+            currentCode = ""
+    return decodedText
+
+def BenchmarkDecode(targetChars=1000000, repeat=3):
+    #Compares the per-bit decoder against the table driven decoder
+    print("==============================================")
+    print(f"Decode benchmark ({targetChars} symbols)")
+    text = LoadSampleText(targetChars)[:targetChars]
+    codeTable = GenerateHuffmanCodes(BuildHuffmanTree(CountFrequency(text)))
+    encodedBits = bitarray("".join(codeTable[ch] for ch in text))
+    data = encodedBits.tobytes()
+
+    legacyTime, legacyText = TimeIt(lambda: LegacyDecode(encodedBits, codeTable), repeat)
+    buildTime, decodeTable = TimeIt(lambda: DecodeTable(codeTable), repeat)
+    tableTime, tableText = TimeIt(lambda: DecodeBits(data, len(encodedBits), decodeTable), repeat)
+
+    if legacyText != text or tableText != text:
+        print("ERROR: Decoded text does not match the input")
+    print(f"Per-bit decoder: {len(text) / legacyTime:,.0f} symbols/sec")
+    print(f"Table decoder:   {len(text) / tableTime:,.0f} symbols/sec (table build {buildTime * 1000:.1f} ms)")
+    print(f"Speedup: {legacyTime / tableTime:.1f}x")
+    print("==============================================\n")
+
+def BenchmarkBackends(targetChars=4000000, repeat=3):
+    #Compares counting and encoding speed of the Python and NumPy backends
+    print("==============================================")
+    print(f"Backend benchmark ({targetChars} symbols)")
+    text = LoadSampleText(targetChars)[:targetChars]
+    megabytes = len(text.encode("utf-8")) / (1 << 20)
+    codeTable = GenerateHuffmanCodes(BuildHuffmanTree(CountFrequency(text)))
+
+    backends = [("python", CountFrequency)]
+    if HuffmanNumpy.Available():
+        backends.append(("numpy", CountFrequencyNumpy))
+    else:
+        print("NumPy is not installed, only the Python backend is measured")
+
+    results = {}
+    for name, countFrequency in backends:
+        countTime, frequency = TimeIt(lambda: countFrequency(text), repeat)
+        encode = BuildEncoder(codeTable, name)
+        encodeTime, encodedBits = TimeIt(lambda: encode(text), repeat)
+        results[name] = encodedBits
+        print(f"{name:>6}: count {megabytes / countTime:8.1f} MB/s | encode {megabytes / encodeTime:8.1f} MB/s")
+
+    if len({bits.tobytes() for bits in results.values()}) > 1:
+        print("ERROR: Backends produced different output")
+    print("==============================================\n")
+
+def BenchmarkOrders(targetChars=2000000, repeat=3):
+    #Compares compression ratio and speed of order-0 and order-1 coding
+    #through Compress and Decompress on a file of sample text
+    print("==============================================")
+    print(f"Order-0 vs order-1 benchmark ({targetChars} symbols)")
+    workDir = tempfile.mkdtemp()
+    try:
+        inputPath = os.path.join(workDir, "sample.txt")
+        with open(inputPath, "w", encoding="utf-8") as outfile:
+            outfile.write(LoadSampleText(targetChars)[:targetChars])
+        originalSize = os.path.getsize(inputPath)
+        megabytes = originalSize / (1 << 20)
+
+        for order in (0, 1):
+            archivePath = os.path.join(workDir, f"order{order}.bin")
+            outputDir = os.path.join(workDir, f"order{order}")
+            compressTime, _ = TimeIt(lambda: Compress([inputPath], archivePath, order=order), repeat)
+            decompressTime, _ = TimeIt(lambda: Decompress(archivePath, outputDir, previewChars=0), repeat)
+            with open(inputPath, "rb") as original, open(os.path.join(outputDir, "decompressed_sample.txt"), "rb") as decoded:
+                if original.read() != decoded.read():
+                    print(f"ERROR: Order {order} output does not match the input")
+            ratio = os.path.getsize(archivePath) / originalSize * 100
+            print(f"order {order}: ratio {ratio:6.2f}% | compress {megabytes / compressTime:6.2f} MB/s | decompress {megabytes / decompressTime:6.2f} MB/s")
+    finally:
+        shutil.rmtree(workDir)
+    print("==============================================\n")
+
+def MeasureBuild(build):
+    #Returns (seconds, peak bytes allocated) of build()
+    #tracemalloc slows everything down a lot, so the memory is measured on a second run
+    seconds, _ = TimeIt(build, 1)
+    tracemalloc.start()
+    result = build()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return seconds, peak
+
+def BenchmarkTrees(alphabets=TREE_ALPHABETS, seed=335):
+    #Compares building a tree of HuffmanNode objects, the flat HuffmanTree
+    #and the code lengths alone for alphabets from 2 to a million symbols
+    print("==============================================")
+    print("Tree build benchmark (seconds | peak MB)")
+    print(f"{'symbols':>9}{'HuffmanNode':>22}{'HuffmanTree':>22}{'BuildCodeLengths':>22}")
+    for alphabet in alphabets:
+        generator = random.Random(seed)
+        frequency = {symbol: generator.randint(1, 1 << 20) for symbol in range(alphabet)}
+        row = f"{alphabet:>9}"
+        for build in (BuildHuffmanTree, BuildTree, BuildCodeLengths):
+            seconds, peak = MeasureBuild(lambda: build(frequency))
+            row += f"{seconds:12.4f}{peak / (1 << 20):10.2f}"
+        print(row)
+    print("==============================================\n")
+
+class CorpusSpec:
+    #This class describes a synthetic corpus
+    #Each spec has
+        #name -> used for the corpus directory and in the results
+        #size -> total size in bytes over all files
+        #alphabet -> number of distinct characters
+        #skew -> Zipf exponent of the character frequencies (0 is uniform)
+        #files -> how many files the size is split over
+        #seed -> seed of the random generator so every run makes the same files
+    def __init__(self, name, size, alphabet, skew, files=1, seed=335):
+        self.name = name
+        self.size = size
+        self.alphabet = alphabet
+        self.skew = skew
+        self.files = files
+        self.seed = seed
+
+    def Key(self):
+        #Identifies the generated files, a spec with other settings gets its own directory
+        return f"{self.name}-{self.size}-{self.alphabet}-{self.skew}-{self.files}-{self.seed}"
+
+QUICK_SUITE = [
+    CorpusSpec("small-files", 256 << 10, 64, 1.0, files=64),
+    CorpusSpec("uniform-bytes", 1 << 20, 256, 0.0),
+    CorpusSpec("skewed-small-alphabet", 1 << 20, 16, 1.5),
+    CorpusSpec("english-like", 4 << 20, 80, 1.1),
+]
+
+FULL_SUITE = QUICK_SUITE + [
+    CorpusSpec("many-files", 16 << 20, 96, 1.0, files=4096),
+    CorpusSpec("large-alphabet", 64 << 20, 4096, 1.0),
+    CorpusSpec("large", 256 << 20, 96, 1.1),
+    CorpusSpec("huge", 1 << 30, 96, 1.1),
+]
+
+def ParseSize(text):
+    #Turns "64KB", "10MB" or "1GB" (or plain bytes) into a number of bytes
+    text = text.strip().upper()
+    for unit, scale in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * scale)
+    return int(text)
+
+def CorpusAlphabet(size):
+    #The first size characters of printable ASCII, then Latin-1 letters, then Greek and beyond
+    #so larger alphabets also exercise multi-byte UTF-8
+    chars = [chr(code) for code in range(32, 127)] + ["\n"]
+    code = 0xC0
+    while len(chars) < size:
+        chars.append(chr(code))
+        code += 1
+    return chars[:size]
+
+def GenerateCorpus(spec, corpusDir, chunkChars=1 << 18):
+    #Writes the files of a corpus into corpusDir (if they are not already there)
+    #and returns their paths
+    directory = os.path.join(corpusDir, spec.Key())
+    filepaths = [os.path.join(directory, f"file{index:05d}.txt") for index in range(spec.files)]
+    if all(os.path.exists(filepath) for filepath in filepaths):
+        return filepaths
+
+    os.makedirs(directory, exist_ok=True)
+    generator = random.Random(spec.seed)
+    chars = CorpusAlphabet(spec.alphabet)
+    weights = [1 / (rank + 1) ** spec.skew for rank in range(len(chars))]
+    fileSize = max(1, spec.size // spec.files)
+    for filepath in filepaths:
+        written = 0
+        with open(filepath, "w", encoding="utf-8", newline="") as outfile:
+            while written < fileSize:
+                text = "".join(generator.choices(chars, weights, k=min(chunkChars, fileSize - written)))
+                outfile.write(text)
+                written += len(text.encode("utf-8"))
+    return filepaths
+
+def PeakMemory(workers=False):
+    #Peak resident memory of this process in bytes (ru_maxrss is in KB on Linux and bytes on macOS)
+    #or with workers, of the largest of its worker processes that have finished
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if workers else resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def RunCase(filepaths, backend, mode, workDir, repeat, variant="default"):
+    #Measures one corpus with one backend, mode and variant, meant to run in its own process
+    #Returns a dictionary of the results
+    options = dict(VARIANTS[variant])
+    decompressOptions = {"workers": options["workers"]} if "workers" in options else {}
+    if options.pop("dictionary", False):
+        dictionaryPath = os.path.join(workDir, "corpus.dict")
+        TrainDictionary(filepaths, dictionaryPath, mode=mode, backend=backend)
+        options["dictionary"] = dictionaryPath
+        decompressOptions["dictionaries"] = [dictionaryPath]
+    totalSize = sum(os.path.getsize(filepath) for filepath in filepaths)
+
+    #Building the tables on their own, from the counts of every file
+    frequency = {}
+    for filepath in filepaths:
+        MergeFrequency(frequency, CountFileFrequency(filepath, backend=backend, mode=mode))
+    def BuildTables():
+        codeTable = CanonicalCodes(BuildCodeLengths(frequency))
+        return DecodeTable(codeTable)
+    tableTime, decodeTable = TimeIt(BuildTables, repeat)
+
+    archivePath = os.path.join(workDir, "archive.bin")
+    outputDir = os.path.join(workDir, "output")
+    compressTime, _ = TimeIt(lambda: Compress(filepaths, archivePath, backend=backend, mode=mode, **options), repeat)
+    decompressTime, _ = TimeIt(lambda: Decompress(archivePath, outputDir, previewChars=0, **decompressOptions), repeat)
+    archiveSize = os.path.getsize(archivePath)
+
+    matches = True
+    for filepath in filepaths:
+        with open(filepath, "rb") as original, open(os.path.join(outputDir, "decompressed_" + os.path.basename(filepath)), "rb") as decoded:
+            matches = matches and original.read() == decoded.read()
+
+    return {
+        "backend": backend,
+        "mode": mode,
+        "variant": variant,
+        "options": {**VARIANTS[variant]},
+        "inputBytes": totalSize,
+        "archiveBytes": archiveSize,
+        "ratio": archiveSize / totalSize if totalSize else None,
+        "compressSeconds": compressTime,
+        "decompressSeconds": decompressTime,
+        "compressMBps": totalSize / (1 << 20) / compressTime,
+        "decompressMBps": totalSize / (1 << 20) / decompressTime,
+        "tableBuildSeconds": tableTime,
+        "symbols": sum(frequency.values()),
+        "alphabet": len(frequency),
+        "peakRssBytes": PeakMemory(),
+        "peakWorkerRssBytes": PeakMemory(workers=True) if "workers" in options else None,
+        "roundTrip": matches,
+    }
+
+def RunCaseIsolated(filepaths, backend, mode, repeat, variant="default"):
+    #Runs RunCase in a freshly spawned process so its peak memory is not mixed up with earlier cases
+    workDir = tempfile.mkdtemp()
+    try:
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            return executor.submit(RunCase, filepaths, backend, mode, workDir, repeat, variant).result()
+    finally:
+        shutil.rmtree(workDir)
+
+def SuiteBackends():
+    #Every backend that can run here
+    backends = ["python"]
+    if HuffmanNumpy.Available():
+        backends.append("numpy")
+    return backends
+
+def ParseVariants(text):
+    #Turns "all" or a comma separated list of variant names into a list of names
+    if text == "all":
+        return list(VARIANTS)
+    variants = [name.strip() for name in text.split(",") if name.strip()]
+    for name in variants:
+        if name not in VARIANTS:
+            raise argparse.ArgumentTypeError(f"unknown variant {name}, pick from {', '.join(VARIANTS)}")
+    return variants
+
+def RunSuite(specs, corpusDir, repeat=1, includeSamples=True, variants=tuple(VARIANTS)):
+    #Runs every corpus with every backend, mode and variant, printing a line per case
+    #Returns the list of result dictionaries
+    corpora = [(spec.name, vars(spec), GenerateCorpus(spec, corpusDir)) for spec in specs]
+    if includeSamples:
+        samples = sorted(glob.glob(os.path.join(SAMPLE_DIR, "*.txt")))
+        if samples:
+            corpora.append(("samples", {"name": "samples", "files": len(samples)}, samples))
+
+    print(f"{'corpus':<24}{'backend':>8}{'mode':>7}{'variant':>12}{'MB':>9}{'ratio':>8}{'comp MB/s':>11}{'decomp MB/s':>13}{'table ms':>10}{'peak MB':>9}")
+    results = []
+    for name, spec, filepaths in corpora:
+        for backend in SuiteBackends():
+            for mode in MODES:
+                for variant in variants:
+                    result = RunCaseIsolated(filepaths, backend, mode, repeat, variant)
+                    result["corpus"] = name
+                    result["spec"] = spec
+                    results.append(result)
+                    peak = f"{result['peakRssBytes'] / (1 << 20):9.1f}" if result["peakRssBytes"] is not None else f"{'-':>9}"
+                    print(f"{name:<24}{backend:>8}{mode:>7}{variant:>12}{result['inputBytes'] / (1 << 20):9.2f}"
+                          f"{result['ratio'] * 100:7.1f}%{result['compressMBps']:11.2f}{result['decompressMBps']:13.2f}"
+                          f"{result['tableBuildSeconds'] * 1000:10.2f}{peak}"
+                          + ("" if result["roundTrip"] else "  ERROR: output does not match"))
+    return results
+
+def WriteResults(path, results):
+    #Writes the results with enough about the machine to compare runs across releases
+    numpyVersion = HuffmanNumpy.LoadNumpy().__version__ if HuffmanNumpy.Available() else None
+    report = {
+        "version": RESULTS_VERSION,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": numpyVersion,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as outfile:
+        json.dump(report, outfile, indent=2)
+
+def BuildParser():
+    parser = argparse.ArgumentParser(prog="Benchmark.py", description="Benchmarks for the compression tool")
+    parser.add_argument("--suite", choices=("quick", "full", "none"), default="quick", help="which corpora to run")
+    parser.add_argument("--size", help="also run a custom corpus of this size (e.g. 64KB, 10MB, 1GB)")
+    parser.add_argument("--alphabet", type=int, default=96, help="alphabet size of the custom corpus")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of the custom corpus")
+    parser.add_argument("--files", type=int, default=1, help="number of files in the custom corpus")
+    parser.add_argument("--seed", type=int, default=335, help="random seed of the custom corpus")
+    parser.add_argument("--variants", type=ParseVariants, default=list(VARIANTS),
+                        help=f"'all' or a comma separated list of {', '.join(VARIANTS)}")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the best time is kept")
+    parser.add_argument("--corpus-dir", default=None, help="keep generated corpora here between runs")
+    parser.add_argument("--json", default=None, help="write the results to this file")
+    parser.add_argument("--micro", action="store_true", help="run the decoder, backend and order benchmarks instead")
+    parser.add_argument("--trees", action="store_true", help="run the tree building benchmark instead")
+    return parser
+
+def Main(argv=None):
+    args = BuildParser().parse_args(argv)
+    if args.trees:
+        BenchmarkTrees()
+        return
+    if args.micro:
+        BenchmarkDecode()
+        BenchmarkBackends()
+        BenchmarkOrders()
+        return
+
+    specs = {"quick": QUICK_SUITE, "full": FULL_SUITE, "none": []}[args.suite]
+    if args.size:
+        specs = specs + [CorpusSpec("custom", ParseSize(args.size), args.alphabet, args.skew, args.files, args.seed)]
+
+    corpusDir = args.corpus_dir or tempfile.mkdtemp()
+    try:
+        results = RunSuite(specs, corpusDir, args.repeat, variants=args.variants)
+    finally:
+        if args.corpus_dir is None:
+            shutil.rmtree(corpusDir)
+    if args.json:
+        WriteResults(args.json, results)
+        print("Results written to", args.json)
+
+if __name__ == "__main__":
+    Main()
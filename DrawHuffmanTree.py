@@ -1,134 +1,266 @@
 import tkinter as tk
+from HuffmanCache import tableCache
+from Huffman import SymbolName
+from HuffmanTree import TreeFromCodes
 
-def BuildTreeFromCodeTable(codeTable):
-    #This function takes in a code table
-    #and rebuilds the huffman tree from it
-    tree = {}
-    for char, code in codeTable.items():
-        current = tree
-        for bit in code:
-            if bit not in current:
-                current[bit] = {}
-            current = current[bit]
-        current['char'] = char #Store the character at each leaf
-    return tree
-
-def LayoutTree(tree, depth, xCounter, positions):
-    #This recursively computes a clean layout for the binary tree
-    #We will use an in-order traversal to assign x cords to each node
-
-    left = tree.get('0')
-    right = tree.get('1')
-
-    #If we have a leaf node, assign current x and increment counter
-    if left is None and right is None:
-        x = xCounter[0]
-        positions[id(tree)] = (x, depth)
-        xCounter[0] += 1
-        return x
-    else:
-        #Process left child if it exists
-        leftX = LayoutTree(left, depth + 1, xCounter, positions) if left is not None else None
-        #Process right child if it exists
-        rightX = LayoutTree(right, depth + 1, xCounter, positions) if right is not None else None
-        #Compute the parent's x as the avg of its children
-        if leftX is not None and rightX is not None:
-            x = (leftX + rightX) / 2
-        elif leftX is not None:
-            x = leftX
-        elif rightX is not None:
-            x = rightX
+#Viewer for the Huffman tree of a code table
+#Tables with thousands of symbols make trees far too big to draw whole, so
+    #the tree is kept as flat arrays built without recursion (see HuffmanTree.py)
+    #only the top COLLAPSE_DEPTH levels are open at first, deeper subtrees are drawn
+    #as a single summary node until they are double-clicked open (double-click again to close)
+    #subtrees too narrow on screen to tell apart are drawn as summary nodes too
+    #only the nodes inside the visible part of the canvas are drawn, again after every
+    #scroll, drag or zoom, so a redraw costs about the same whatever the size of the tree
+#The scroll wheel (or + and -) zooms around the mouse pointer, dragging pans
+
+COLLAPSE_DEPTH = 6      #Levels opened below the root, and below a subtree that is opened
+MARGIN = 50
+H_SPACING = 50          #Horizontal distance between neighbouring leaves at zoom 1
+V_SPACING = 100         #Vertical distance between levels at zoom 1
+RADIUS = 20
+LOD_PIXELS = 12         #Open subtrees narrower than this on screen are drawn as summary nodes
+MIN_ZOOM = 0.02
+MAX_ZOOM = 4.0
+ZOOM_STEP = 1.25
+
+#Define colors for various elements
+NODE_FILL_COLOR = "#add8e6"      #Light blue for node fill
+SUMMARY_FILL_COLOR = "#ffe4b5"   #Moccasin for collapsed subtrees
+NODE_OUTLINE_COLOR = "#000080"   #Navy blue for node outline
+TEXT_COLOR = "#000000"           #Black for node text
+EDGE_COLOR = "#008000"           #Green for connecting lines
+BRANCH_LABEL_COLOR = "#ff4500"   #OrangeRed for branch labels
+
+class TreeViewer:
+    #This class draws a HuffmanTree on a canvas a viewport at a time
+    #Each viewer has
+        #canvas -> the Tk canvas it draws on
+        #tree -> the HuffmanTree being shown
+        #depth, leaves -> the depth and number of symbols of every node of the tree
+        #zoom -> scale of the drawing, 1 is the normal size
+        #expanded -> nodes the user opened (their subtrees get COLLAPSE_DEPTH more levels)
+        #collapsed -> nodes the user closed
+        #x -> slot (leaf position) of every node in the current layout, fractional for inner nodes
+        #span -> (first slot, last slot) under every node in the current layout
+        #open -> nodes whose children are part of the current layout
+        #slots, layoutDepth -> the size of the current layout
+        #redrawPending -> True while a redraw is waiting for Tk to be idle
+    def __init__(self, canvas, tree):
+        self.canvas = canvas
+        self.tree = tree
+        self.depth = tree.Depths()
+        self.leaves = tree.Leaves()
+        self.zoom = 1.0
+        self.expanded = set()
+        self.collapsed = set()
+        self.x = {}
+        self.span = {}
+        self.open = set()
+        self.slots = 0
+        self.layoutDepth = 0
+        self.redrawPending = False
+        self.Layout()
+
+    def Layout(self):
+        #Places the nodes that are open, iteratively and in order so leaves get slots left to right
+        #Only visible nodes are placed, so this costs nothing for subtrees that are closed
+        tree = self.tree
+        self.x = {}
+        self.span = {}
+        self.open = set()
+        slot = 0
+        maxDepth = 0
+        stack = [(tree.root, COLLAPSE_DEPTH, False)] if len(tree) else []
+        while stack:
+            node, levelsLeft, childrenPlaced = stack.pop()
+            if childrenPlaced:
+                children = tree.Children(node)
+                self.x[node] = sum(self.x[child] for child in children) / len(children)
+                self.span[node] = (self.span[children[0]][0], self.span[children[-1]][1])
+                continue
+
+            maxDepth = max(maxDepth, self.depth[node])
+            isOpen = not tree.IsLeaf(node) and node not in self.collapsed and (levelsLeft > 0 or node in self.expanded)
+            if not isOpen:
+                self.x[node] = slot
+                self.span[node] = (slot, slot)
+                slot += 1
+                continue
+
+            self.open.add(node)
+            childLevels = (COLLAPSE_DEPTH if node in self.expanded else levelsLeft) - 1
+            stack.append((node, levelsLeft, True))
+            for child in reversed(tree.Children(node)):
+                stack.append((child, childLevels, False))
+        self.slots = slot
+        self.layoutDepth = maxDepth
+
+    def Spacing(self):
+        #Returns (horizontal spacing, vertical spacing, node radius) at the current zoom
+        return H_SPACING * self.zoom, V_SPACING * self.zoom, max(RADIUS * self.zoom, 2)
+
+    def Position(self, node):
+        hSpacing, vSpacing, radius = self.Spacing()
+        return MARGIN + self.x[node] * hSpacing, MARGIN + self.depth[node] * vSpacing
+
+    def Size(self):
+        #Returns the width and height of the whole drawing
+        hSpacing, vSpacing, radius = self.Spacing()
+        return 2 * MARGIN + max(self.slots - 1, 0) * hSpacing, 2 * MARGIN + self.layoutDepth * vSpacing
+
+    def ScheduleRedraw(self, event=None):
+        #Redraws once Tk is idle, so a burst of scroll events only redraws once
+        if not self.redrawPending:
+            self.redrawPending = True
+            self.canvas.after_idle(self.Redraw)
+
+    def Redraw(self):
+        #Draws the nodes in (or next to) the visible part of the canvas
+        self.redrawPending = False
+        canvas = self.canvas
+        tree = self.tree
+        hSpacing, vSpacing, radius = self.Spacing()
+        width, height = self.Size()
+        canvas.config(scrollregion=(0, 0, width, height))
+        canvas.delete("all")
+
+        left = canvas.canvasx(0) - hSpacing
+        right = canvas.canvasx(canvas.winfo_width()) + hSpacing
+        top = canvas.canvasy(0) - vSpacing
+        bottom = canvas.canvasy(canvas.winfo_height()) + vSpacing
+        firstSlot = (left - MARGIN) / hSpacing
+        lastSlot = (right - MARGIN) / hSpacing
+        showText = radius >= 8
+        font = ("Helvetica", max(int(12 * self.zoom), 6), "bold")
+
+        stack = [tree.root] if len(tree) else []
+        while stack:
+            node = stack.pop()
+            spanFirst, spanLast = self.span[node]
+            if spanLast < firstSlot or spanFirst > lastSlot:
+                continue #Nothing under this node is on screen
+            x, y = self.Position(node)
+            if y - radius > bottom:
+                continue
+
+            summary = node in self.open and (spanLast - spanFirst + 1) * hSpacing < LOD_PIXELS
+            isOpen = node in self.open and not summary
+            if isOpen:
+                for bit, child in tree.BranchChildren(node):
+                    childX, childY = self.Position(child)
+                    #Draw line from parent's bottom to child's top.
+                    canvas.create_line(x, y + radius, childX, childY - radius, fill=EDGE_COLOR, width=2)
+                    if showText:
+                        #Label the line with the branch bit.
+                        canvas.create_text((x + childX) / 2, (y + childY) / 2, text=bit, fill=BRANCH_LABEL_COLOR, font=font)
+                    stack.append(child)
+
+            if y + radius < top:
+                continue #Only the edges of this node reach the screen
+            tags = ("node", f"node{node}")
+            if tree.IsLeaf(node) or isOpen:
+                canvas.create_oval(x - radius, y - radius, x + radius, y + radius, fill=NODE_FILL_COLOR, outline=NODE_OUTLINE_COLOR, width=2, tags=tags)
+                label = SymbolName(tree.symbol[node]) if tree.IsLeaf(node) else ""
+            else:
+                #A closed subtree, drawn as a box with how many symbols are in it
+                canvas.create_rectangle(x - radius, y - radius, x + radius, y + radius, fill=SUMMARY_FILL_COLOR, outline=NODE_OUTLINE_COLOR, width=2, tags=tags)
+                label = f"+{self.leaves[node]}"
+            if showText and label:
+                canvas.create_text(x, y, text=label, fill=TEXT_COLOR, font=font, tags=tags)
+
+    def NodeAt(self, event):
+        #Returns the node drawn under the mouse, or None
+        for item in self.canvas.find_withtag("current"):
+            for tag in self.canvas.gettags(item):
+                if tag.startswith("node") and tag != "node":
+                    return int(tag[4:])
+        return None
+
+    def Toggle(self, event):
+        #Opens a closed subtree or closes an open one, keeping it under the mouse
+        node = self.NodeAt(event)
+        if node is None or self.tree.IsLeaf(node):
+            return
+        if node in self.open and (self.span[node][1] - self.span[node][0] + 1) * self.Spacing()[0] < LOD_PIXELS:
+            #Open already, just too small to see, so zoom in on it instead
+            self.ZoomAt(ZOOM_STEP * ZOOM_STEP, event.x, event.y)
+            return
+        if node in self.open:
+            self.expanded.discard(node)
+            self.collapsed.add(node)
         else:
-            x = xCounter[0]
-            xCounter[0] += 1
-
-        positions[id(tree)] = (x, depth)
-        return x
-    
-def DrawTreeWithPositions(canvas, tree, positions, margin, hSpacing, vSpacing, radius=20):
-    #This function will draw the tree using precomputed positions
-
-    #Define colors for various elements
-    nodeFillColor = "#add8e6"      #Light blue for node fill
-    nodeOutlineColor = "#000080"   #Navy blue for node outline
-    textColor = "#000000"          #Black for node text
-    edgeColor = "#008000"          #Green for connecting lines
-    branchLabelColor = "#ff4500"   #OrangeRed for branch labels
-
-    xLogical, depth = positions[id(tree)]
-    x = margin + xLogical * hSpacing
-    y = margin + depth * vSpacing
-
-    #Leaf node
-    label = tree.get('char', '')
-    canvas.create_oval(x - radius, y - radius, x + radius, y + radius, fill=nodeFillColor, outline=nodeOutlineColor, width=2)
-    canvas.create_text(x, y, text=label, fill=textColor, font=("Helvetica", 12, "bold"))
-
-    for bit in ['0', '1']:
-        if bit in tree:
-            child = tree[bit]
-            childXLogical, childDepth = positions[id(child)]
-            childX = margin + childXLogical * hSpacing
-            childY = margin + childDepth * vSpacing
-            #Draw line from parent's bottom to child's top.
-            canvas.create_line(x, y + radius, childX, childY - radius, fill=edgeColor, width=2)
-            #Label the line with the branch bit.
-            mid_x = (x + childX) / 2
-            mid_y = (y + childY) / 2
-            canvas.create_text(mid_x, mid_y, text=bit, fill=branchLabelColor, font=("Helvetica", 10, "bold"))
-            #Recursively draw the child node.
-            DrawTreeWithPositions(canvas, child, positions, margin, hSpacing, vSpacing, radius)
-
-def ComputeAndDrawTree(canvas, tree):
-    #First this computes the tree's layout
-    #then this draws it
-    positions = {}
-    xCounter = [0]
-    LayoutTree(tree, 0, xCounter, positions)
-    
-    #Set desired spacing parameters.
-    margin = 50
-    hSpacing = 50   #horizontal distance per in-order unit
-    vSpacing = 100  #vertical spacing per level
-
-    #Determine the maximum extents from the positions.
-    maxX = max(pos[0] for pos in positions.values())
-    maxDepth = max(pos[1] for pos in positions.values())
-
-    #Adjust the canvas scrollregion based on the drawing dimensions.
-    canvas.config(scrollregion=(0, 0, margin + (maxX + 1) * hSpacing, margin + (maxDepth + 1) * vSpacing))
-    
-    #Clear the canvas before drawing.
-    canvas.delete("all")
-    
-    #Draw the tree using the computed positions.
-    DrawTreeWithPositions(canvas, tree, positions, margin, hSpacing, vSpacing)
+            self.collapsed.discard(node)
+            self.expanded.add(node)
+        before = self.Position(node)
+        self.Layout()
+        self.KeepInPlace(before, self.Position(node))
+        self.Redraw()
 
+    def ZoomAt(self, factor, screenX, screenY):
+        #Zooms by factor keeping the point under (screenX, screenY) where it is
+        zoom = min(max(self.zoom * factor, MIN_ZOOM), MAX_ZOOM)
+        if zoom == self.zoom:
+            return
+        canvasX = self.canvas.canvasx(screenX)
+        canvasY = self.canvas.canvasy(screenY)
+        factor = zoom / self.zoom
+        self.zoom = zoom
+        self.KeepInPlace((canvasX, canvasY), (MARGIN + (canvasX - MARGIN) * factor, MARGIN + (canvasY - MARGIN) * factor))
+        self.Redraw()
+
+    def KeepInPlace(self, before, after):
+        #Scrolls so a point that moved from before to after (canvas coordinates) stays put on screen
+        width, height = self.Size()
+        self.canvas.config(scrollregion=(0, 0, width, height))
+        left = self.canvas.canvasx(0) + after[0] - before[0]
+        top = self.canvas.canvasy(0) + after[1] - before[1]
+        self.canvas.xview_moveto(max(left, 0) / max(width, 1))
+        self.canvas.yview_moveto(max(top, 0) / max(height, 1))
+
+    def OnWheel(self, event):
+        if getattr(event, "num", None) == 5 or getattr(event, "delta", 0) < 0:
+            self.ZoomAt(1 / ZOOM_STEP, event.x, event.y)
+        else:
+            self.ZoomAt(ZOOM_STEP, event.x, event.y)
 
 def ShowHuffmanTree(codeTable, rootUIElement):
     #DO ALL VALIDATION BEFORE CALLING THIS FUNCTION
     #This function will take in a code table (straight from the .bin file)
     #and the root UI element
 
-    tree = BuildTreeFromCodeTable(codeTable)
-    
+    #The tree is only read while drawing so one built for the same table before can be reused
+    tree = tableCache.Get("tree", codeTable, lambda: TreeFromCodes(codeTable))
+
     #Create a new dialog window with a canvas to display the tree.
     treeWindow = tk.Toplevel(rootUIElement)
     treeWindow.title("Huffman Tree")
     treeWindow.attributes('-zoomed', True)
 
+    infoLabel = tk.Label(treeWindow, font=("Consolas", 9),
+                         text=f"{len(codeTable)} symbols, {len(tree)} nodes, deepest code {max(map(len, codeTable.values()), default=0)} bits | "
+                              "double-click a node to open or close it, scroll to zoom, drag to pan")
+    infoLabel.pack(fill=tk.X)
+
     #Create a frame to hold the canvas and scrollbars.
     frame = tk.Frame(treeWindow)
     frame.pack(fill=tk.BOTH, expand=True)
 
-    #Create the canvas with an initially large scrollable region.
-    treeCanvas = tk.Canvas(frame, bg="white", scrollregion=(0, 0, 5000, 5000))
-    treeCanvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    treeCanvas = tk.Canvas(frame, bg="white")
+    viewer = TreeViewer(treeCanvas, tree)
+
+    #Add vertical and horizontal scrollbars, which redraw the newly visible part as they move
+    def ScrollX(*args):
+        treeCanvas.xview(*args)
+        viewer.ScheduleRedraw()
 
-    #Add vertical and horizontal scrollbars.
-    vbar = tk.Scrollbar(frame, orient=tk.VERTICAL, command=treeCanvas.yview)
+    def ScrollY(*args):
+        treeCanvas.yview(*args)
+        viewer.ScheduleRedraw()
+
+    vbar = tk.Scrollbar(frame, orient=tk.VERTICAL, command=ScrollY)
     vbar.pack(side=tk.RIGHT, fill=tk.Y)
-    hbar = tk.Scrollbar(treeWindow, orient=tk.HORIZONTAL, command=treeCanvas.xview)
+    treeCanvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    hbar = tk.Scrollbar(treeWindow, orient=tk.HORIZONTAL, command=ScrollX)
     hbar.pack(side=tk.BOTTOM, fill=tk.X)
 
     #Configure the canvas to use the scrollbars.
@@ -140,13 +272,26 @@ def ShowHuffmanTree(codeTable, rootUIElement):
 
     def onMouseDrag(event):
         treeCanvas.scan_dragto(event.x, event.y, gain=1)
+        viewer.ScheduleRedraw()
+
+    def onKey(event):
+        factor = ZOOM_STEP if event.char in "+=" else 1 / ZOOM_STEP
+        viewer.ZoomAt(factor, treeCanvas.winfo_width() / 2, treeCanvas.winfo_height() / 2)
 
     treeCanvas.bind("<ButtonPress-1>", onButtonPress)
     treeCanvas.bind("<B1-Motion>", onMouseDrag)
+    treeCanvas.bind("<Double-Button-1>", viewer.Toggle)
+    treeCanvas.bind("<MouseWheel>", viewer.OnWheel)
+    treeCanvas.bind("<Button-4>", viewer.OnWheel)
+    treeCanvas.bind("<Button-5>", viewer.OnWheel)
+    treeCanvas.bind("<Configure>", viewer.ScheduleRedraw)
+    for key in ("+", "=", "-"):
+        treeWindow.bind(key, onKey)
 
-    #Compute the layout and draw the tree.
-    ComputeAndDrawTree(treeCanvas, tree)
-
-    #Update the window.
+    #Start with the root in the middle of the window
     treeWindow.update()
-
+    width, height = viewer.Size()
+    rootX, rootY = viewer.Position(tree.root)
+    treeCanvas.config(scrollregion=(0, 0, width, height))
+    treeCanvas.xview_moveto(max(rootX - treeCanvas.winfo_width() / 2, 0) / max(width, 1))
+    viewer.Redraw()
@@ -1,22 +1,41 @@
 import tkinter as tk
 
 import os
-import pickle 
+import queue
+import threading
 
-from tkinter import filedialog, messagebox, scrolledtext
-from Huffman import Compress, Decompress, GetFileSize
+from tkinter import filedialog, messagebox, scrolledtext, ttk
+from Huffman import Compress, Decompress, GetFileSize, LoadCodeTable, SymbolName, CanonicalCodes, OutputPath
+from HuffmanArchive import ArchiveReader
+from HuffmanStats import ControlledStats, JobCancelled
 from DrawHuffmanTree import ShowHuffmanTree
 
+#Compressing and decompressing run on a worker thread so the window stays responsive
+#The worker only talks to the window through jobEvents, which PollJob empties
+#on the Tk thread every POLL_MS, since Tk widgets must only be touched from that thread
+#The decompressed files are previewed a page at a time straight from disk
+
 #Global Variables
 compressFiles = []
 totalSize = 0 #Running total of size of all files uploaded
 decompressFilePath = None
+DECOMPRESS_DIR = "decompressed_files"
+PAGE_BYTES = 16384 #Bytes of a decompressed file shown per page
+POLL_MS = 50 #How often the window checks on a running job
+MAX_CODES_SHOWN = 5000 #Codes listed in the codes box, larger tables are cut short
+
+currentJob = None #ControlledStats of the running job, None when idle
+jobEvents = queue.Queue() #(kind, value) messages from the worker thread
+previewFiles = [] #Output paths of the last decompress
+previewFile = 0 #Index into previewFiles
+previewPage = 0
 
 #Button Functions 
 def AddFile():
-    #Add a text file to the list of files to be compressed
+    #Add a file to the list of files to be compressed
+    #Anything other than UTF-8 text needs Binary Mode turned on
     global totalSize
-    filepath = filedialog.askopenfilename(filetypes=[("Text Files", "*.txt")])
+    filepath = filedialog.askopenfilename(filetypes=[("Text Files", "*.txt"), ("All Files", "*")])
     if filepath:
         fileSize = GetFileSize(filepath)  #Get file size in bytes
         compressFiles.append(filepath)
@@ -38,6 +57,84 @@ def RemoveFile():
         totalSizeLabel.config(text=f"Total Size: {totalSize} bytes")
 
 
+#Background jobs
+def StartJob(name, work, total, finished):
+    #Runs work(stats) on a worker thread with a progress bar and the cancel button
+    #total is roughly how many symbols the job will read, for the progress bar
+    #finished(result, stats) is called on the Tk thread once the job succeeds
+    global currentJob
+    if currentJob is not None:
+        messagebox.showerror("Busy", "Please wait for the current job to finish or cancel it")
+        return
+    stats = ControlledStats(lambda event, values, stats: jobEvents.put((event, values)))
+    currentJob = stats
+
+    def Run():
+        try:
+            jobEvents.put(("finished", work(stats)))
+        except JobCancelled:
+            jobEvents.put(("cancelled", None))
+        except Exception as e:
+            jobEvents.put(("error", e))
+
+    progressBar.configure(maximum=max(total, 1), value=0)
+    statusLabel.config(text=name + "...")
+    SetBusy(True)
+    threading.Thread(target=Run, daemon=True).start()
+    root.after(POLL_MS, PollJob, name, finished)
+
+def PollJob(name, finished):
+    #Handles everything the worker has reported since the last poll
+    global currentJob
+    while True:
+        try:
+            kind, value = jobEvents.get_nowait()
+        except queue.Empty:
+            break
+        if kind == "total":
+            #The worker found out how big the job really is
+            progressBar.configure(maximum=max(value, 1))
+        elif kind == "chunk":
+            #step() would wrap around to 0 if the estimate of the total was low
+            progressBar.configure(value=min(progressBar["value"] + value["size"], progressBar["maximum"]))
+        elif kind == "phase":
+            statusLabel.config(text=f"{name}: {value['name']} done")
+        elif kind == "file":
+            statusLabel.config(text=f"{name}: {value['file'].name}")
+        elif kind in ("finished", "cancelled", "error"):
+            stats = currentJob
+            currentJob = None
+            SetBusy(False)
+            progressBar.configure(value=progressBar["maximum"] if kind == "finished" else 0)
+            if kind == "finished":
+                statusLabel.config(text=f"{name}: done in {stats.seconds:.2f}s")
+                finished(value, stats)
+            elif kind == "cancelled":
+                statusLabel.config(text=f"{name}: cancelled")
+            else:
+                statusLabel.config(text=f"{name}: failed")
+                messagebox.showerror("Error", str(value))
+            return
+    root.after(POLL_MS, PollJob, name, finished)
+
+def CancelJob():
+    if currentJob is not None:
+        currentJob.Cancel()
+        statusLabel.config(text="Cancelling...")
+
+def SetBusy(busy):
+    #Only one job runs at a time, so the buttons that start one are off while it runs
+    state = tk.DISABLED if busy else tk.NORMAL
+    for button in (compressButton, decompressButton):
+        button.config(state=state)
+    cancelButton.config(state=tk.NORMAL if busy else tk.DISABLED)
+
+def SetText(box, text):
+    box.configure(state='normal')
+    box.delete("1.0", tk.END)
+    box.insert(tk.INSERT, text)
+    box.configure(state='disabled')
+
 def CompressFiles():
     #Compresses the selected files
     if not compressFiles:
@@ -45,33 +142,38 @@ def CompressFiles():
         return
     
     outputFilename = outputEntry.get().strip() or "compressed.bin"
-
-    try:
-        Compress(compressFiles, outputFilename)
-    except Exception as e:
-        messagebox.showerror("Error", str(e))
-        
-    #update the huffman codes textbox
-    try:
-        with open(outputFilename, "rb") as infile:
-            data = pickle.load(infile)
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to load compressed file: {e}")
+    filepaths = list(compressFiles)
+    mode = "bytes" if binaryMode.get() else "text"
+
+    def Work(stats):
+        try:
+            return Compress(filepaths, outputFilename, mode=mode, stats=stats)
+        except JobCancelled:
+            #Do not leave half an archive behind
+            if os.path.exists(outputFilename):
+                os.remove(outputFilename)
+            raise
+
+    #Every file is read twice, once to count and once to encode
+    StartJob("Compressing", Work, 2 * totalSize, lambda stats, jobStats: CompressFinished(stats))
+
+def CompressFinished(stats):
+    if stats is None:
+        messagebox.showerror("Error", "No data found in the selected files")
         return
-    codeTable = data.get("t")
-
-    codes = ""
-    for char, code in codeTable.items():
-        codes += (char + " : " + code + "\n")
-    codebox.configure(state='normal')
-    codebox.delete("1.0", tk.END)
-    codebox.insert(tk.INSERT, codes)
-    codebox.configure(state='disabled')
+
+    #update the huffman codes textbox from the table Compress just built
+    codeTable = CanonicalCodes(stats.codeTables[0]) if stats.codeTables else {}
+    codes = [SymbolName(char) + " : " + code for char, code in list(codeTable.items())[:MAX_CODES_SHOWN]]
+    if len(codeTable) > MAX_CODES_SHOWN:
+        codes.append(f"... and {len(codeTable) - MAX_CODES_SHOWN} more")
+    if len(stats.codeTables) > 1:
+        codes.append(f"({len(stats.codeTables)} code tables, showing the first)")
+    SetText(codebox, "\n".join(codes))
     
     #get compressed filesize and size ratio
-    compressed_filesize = GetFileSize(outputFilename)
-    ratio = round(((compressed_filesize/totalSize) * 100), 2)
-    compdetails.config(text=f"Compressed Size : {compressed_filesize} Bytes | Ratio : {ratio}%")
+    ratio = round(((stats.bytesOut / max(stats.bytesIn, 1)) * 100), 2)
+    compdetails.config(text=f"Compressed Size : {stats.bytesOut} Bytes | Ratio : {ratio}%")
 
 def SelectDecompressFile():
     #Lets the user select a file to be decompressed
@@ -88,16 +190,58 @@ def DecompressFile():
         messagebox.showerror("No Files Selected", "Please select a .bin file to decompress")
         return
     
-    try:
-        contents = Decompress(decompressFilePath)
-    except Exception as e:
-        messagebox.showerror("Error", str(e))
-
-    #update the textbox for the decompressed contents
-    decompressedbox.configure(state="normal")
-    decompressedbox.delete("1.0", tk.END)
-    decompressedbox.insert(tk.INSERT, contents)
-    decompressedbox.configure(state="disabled")
+    archivePath = decompressFilePath
+
+    def Work(stats):
+        #Archives list how many symbols they hold in their directory, older pickled files
+        #would have to be decoded to find out, so those keep the file size as the estimate
+        with ArchiveReader(archivePath) as reader:
+            if reader.IsArchive():
+                jobEvents.put(("total", sum(entry.symbolCount for entry in reader.Entries())))
+        #Nothing is kept for the preview, it is read back from the files a page at a time
+        return Decompress(archivePath, DECOMPRESS_DIR, previewChars=0, stats=stats)
+
+    StartJob("Decompressing", Work, GetFileSize(archivePath),
+             lambda contents, stats: ShowPreview([OutputPath(DECOMPRESS_DIR, fileStats.name) for fileStats in stats.files]))
+
+#Paged preview of the decompressed files
+def ShowPreview(outputPaths):
+    global previewFiles, previewFile, previewPage
+    previewFiles = outputPaths
+    previewFile = 0
+    previewPage = 0
+    ShowPage()
+
+def PageCount(path):
+    return max(1, -(-GetFileSize(path) // PAGE_BYTES))
+
+def ReadPage(path, page):
+    #Reads one page of a file, pages are cut by bytes so a character split between
+    #two pages shows up as a replacement character at the edges
+    with open(path, "rb") as infile:
+        infile.seek(page * PAGE_BYTES)
+        return infile.read(PAGE_BYTES).decode("utf-8", "replace")
+
+def ShowPage():
+    if not previewFiles:
+        return
+    path = previewFiles[previewFile]
+    SetText(decompressedbox, ReadPage(path, previewPage))
+    pageLabel.config(text=f"{os.path.basename(path)} ({previewFile + 1}/{len(previewFiles)}) "
+                          f"page {previewPage + 1}/{PageCount(path)}")
+
+def MovePage(step):
+    global previewPage
+    if previewFiles:
+        previewPage = min(max(previewPage + step, 0), PageCount(previewFiles[previewFile]) - 1)
+        ShowPage()
+
+def MoveFile(step):
+    global previewFile, previewPage
+    if previewFiles:
+        previewFile = min(max(previewFile + step, 0), len(previewFiles) - 1)
+        previewPage = 0
+        ShowPage()
     
 #Tree drawing function
 def ShowHuffmanTreeDialog():
@@ -108,13 +252,10 @@ def ShowHuffmanTreeDialog():
         return
     
     try:
-        with open(decompressFilePath, "rb") as infile:
-            data = pickle.load(infile)
+        codeTable = LoadCodeTable(decompressFilePath)
     except Exception as e:
         messagebox.showerror("Error", f"Failed to load compressed file: {e}")
         return 
-    
-    codeTable = data.get("t")
         
     if codeTable is None:
         messagebox.showerror("Error", "No Huffman code table found in the file")
@@ -167,6 +308,11 @@ outputEntry = tk.Entry(compressionFrame, width=50)
 outputEntry.pack(fill=tk.X, pady=5)
 outputEntry.insert(0, "compressed.bin")
 
+#Checkbox to compress the files as raw bytes instead of text
+binaryMode = tk.BooleanVar(value=False)
+binaryCheck = tk.Checkbutton(compressionFrame, text="Binary Mode (any file type)", font=("Consolas", 10), variable=binaryMode)
+binaryCheck.pack(pady=5)
+
 #Button to compress files
 compressButton = tk.Button(compressionFrame, text="Compress Files", font=("Consolas", 10), command=CompressFiles)
 compressButton.pack(pady=5)
@@ -212,6 +358,26 @@ decompressedbox = scrolledtext.ScrolledText(decompressFrame, wrap=tk.WORD, width
 decompressedbox.configure(state='disabled')
 decompressedbox.pack(fill=tk.X, pady=5)
 
+#Buttons to page through the decompressed files
+pageFrame = tk.Frame(decompressFrame)
+pageFrame.pack(fill=tk.X, pady=5)
+tk.Button(pageFrame, text="<< File", font=("Consolas", 8), command=lambda: MoveFile(-1)).pack(side=tk.LEFT)
+tk.Button(pageFrame, text="< Page", font=("Consolas", 8), command=lambda: MovePage(-1)).pack(side=tk.LEFT)
+tk.Button(pageFrame, text="File >>", font=("Consolas", 8), command=lambda: MoveFile(1)).pack(side=tk.RIGHT)
+tk.Button(pageFrame, text="Page >", font=("Consolas", 8), command=lambda: MovePage(1)).pack(side=tk.RIGHT)
+pageLabel = tk.Label(pageFrame, text="", font=("Consolas", 8))
+pageLabel.pack(side=tk.LEFT, expand=True)
+
+#-----Progress of the running job-----
+progressFrame = tk.Frame(root)
+progressFrame.pack(fill=tk.X, padx=20)
+statusLabel = tk.Label(progressFrame, text="Ready", font=("Consolas", 8), width=40, anchor=tk.W)
+statusLabel.pack(side=tk.LEFT)
+progressBar = ttk.Progressbar(progressFrame, mode="determinate")
+progressBar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+cancelButton = tk.Button(progressFrame, text="Cancel", font=("Consolas", 10), state=tk.DISABLED, command=CancelJob)
+cancelButton.pack(side=tk.LEFT)
+
 #Exit button to close the application
 exitButton = tk.Button(root, text="Exit", font=("Consolas", 10), width=10, command=root.destroy)
 exitButton.pack(pady=10)
@@ -1,7 +1,20 @@
-import heapq
+import codecs
 import pickle
 import os
+import time
+from collections import Counter, deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice, repeat
 from bitarray import bitarray
+from HuffmanNumpy import CountFrequencyNumpy, CountBytesNumpy, NumpyEncoder
+import HuffmanNumpy
+from HuffmanDecoder import DecodeTable, DecodeBits, IterDecodeBits, DecodeContextBits, IterDecodeContextBits
+from HuffmanArchive import ArchiveEntry, ArchiveReader, ArchiveWriter, DictionaryRef, PackTable, CheckBlock, IsSafeName, METHOD_HUFFMAN, METHOD_STORED, METHOD_ORDER1, METHOD_NAMES, FLAG_BYTES
+from HuffmanCache import tableCache
+from HuffmanDictionary import DictionaryId, LoadDictionary, FindDictionary, SaveDictionary, DICTIONARY_EXTENSION
+from HuffmanStats import ResolveStats, NULL_STATS
+from HuffmanTree import BuildTree, TreeFromCodes, NO_NODE
 
 #Note from Chris:
 #It may be better to use something like the Deflate algorithm
@@ -9,6 +22,13 @@ from bitarray import bitarray
 #since the Huffman Tree takes up so much space
 #See https://en.wikipedia.org/wiki/Deflate
 
+CHUNK_SIZE = 1 << 20 #Number of characters read from a file at a time
+BACKENDS = ("auto", "python", "numpy")
+MODES = ("text", "bytes")
+MAX_CODE_LENGTH = 24 #Longest code Compress will make, keeps the decode tables small
+TABLE_MODES = ("shared", "auto")
+ORDERS = (0, 1)      #0 codes every symbol on its own, 1 picks the code table by the previous symbol
+
 class HuffmanNode:
     #This class is the structure for a Node in the Huffman Tree
     #Each node has 
@@ -16,6 +36,9 @@ class HuffmanNode:
         #A character (only if it isn't an internal Node)
         #A Left Child
         #A Right Child
+    #Compress does not build trees of these, see HuffmanTree.py for the flat tree used instead
+    __slots__ = ("freq", "char", "left", "right")
+
     def __init__(self, freq, char=None, left=None, right=None):
         self.freq = freq
         self.char = char
@@ -30,10 +53,12 @@ class HuffmanNode:
         return self.freq > other.freq
     
     
-def CountFrequency(text):
+def CountFrequency(text, freq=None):
     #This takes an input string and counts the occurance
     #of each character
-    freq = {}
+    #Pass in an existing freq dictionary to keep adding to it
+    if freq is None:
+        freq = {}
     for char in text:
         freq[char] = freq.get(char, 0) + 1
     return freq
@@ -41,23 +66,21 @@ def CountFrequency(text):
 def BuildHuffmanTree(frequency):
     #This builds the Huffman tree based on char frequency
     #and returns the root node of the tree
-    heap = []
-    for char, freq in frequency.items():
-        node = HuffmanNode(freq, char)
-        heapq.heappush(heap, node)
-
-    while len(heap) > 1:
-        left = heapq.heappop(heap)
-        right = heapq.heappop(heap)
-        merged = HuffmanNode(left.freq + right.freq, None, left, right)
-        heapq.heappush(heap, merged)
-    
-    return heap[0] if heap else None
+    #The tree is built flat by BuildTree (so ties always break the same way)
+    #and then turned into nodes, children come before their parents in it
+    tree = BuildTree(frequency)
+    nodes = []
+    for node in range(len(tree)):
+        left = nodes[tree.left[node]] if tree.left[node] != NO_NODE else None
+        right = nodes[tree.right[node]] if tree.right[node] != NO_NODE else None
+        nodes.append(HuffmanNode(tree.weight[node], tree.symbol[node], left, right))
+    return nodes[tree.root] if nodes else None
 
 def GenerateHuffmanCodes(node, prefix=""):
-    #Recursively traverse the tree to generate binary codes
-    #This function takes in the current node and the prefix built so far
+    #Traverse the tree to generate binary codes
+    #This function takes in the root node and the prefix to start from
     #then returns a dictionary mapping characters to their codes
+    #It keeps its own stack rather than recursing, very uneven trees can be deeper than the recursion limit
 
     if node is None:
         return {}
@@ -67,90 +90,1153 @@ def GenerateHuffmanCodes(node, prefix=""):
         return {node.char: prefix or "0"} #If prefix is none (ie single char) then it will just have a code of "0"
     
     codes = {}
-    codes.update(GenerateHuffmanCodes(node.left, prefix + "0"))
-    codes.update(GenerateHuffmanCodes(node.right, prefix + "1"))
+    stack = [(node, prefix)]
+    while stack:
+        node, prefix = stack.pop()
+        if node.char is not None:
+            codes[node.char] = prefix
+            continue
+        for child, bit in ((node.right, "1"), (node.left, "0")):
+            if child is not None:
+                stack.append((child, prefix + bit))
     return codes
 
-def Compress(inputFilepaths, outputFilepath = "compressed.bin"):
+def CodeLengths(codeTable):
+    #Returns a dictionary mapping each character to the length of its code
+    return {char: len(code) for char, code in codeTable.items()}
+
+def BuildCodeLengths(frequency, maxLength=None):
+    #Works out the Huffman code length of every character without building a tree
+    #This uses the in-place method of Moffat and Katajainen: once the counts are sorted
+    #the lengths come out of three linear passes over a single list
+    #If maxLength is set, longer codes are cut down to it (see LimitCodeLengths)
+    #Returns a dictionary mapping each character to its code length
+    chars = sorted(frequency, key=lambda char: (frequency[char], char))
+    n = len(chars)
+    if n == 0:
+        return {}
+    if n == 1:
+        return {chars[0]: 1}
+
+    A = [frequency[char] for char in chars]
+
+    #Phase 1: combine the two smallest weights over and over, internal nodes
+    #reuse the list and store the index of their parent once they are used
+    A[0] += A[1]
+    root = 0
+    leaf = 2
+    for node in range(1, n - 1):
+        if leaf >= n or A[root] < A[leaf]:
+            A[node] = A[root]
+            A[root] = node
+            root += 1
+        else:
+            A[node] = A[leaf]
+            leaf += 1
+        if leaf >= n or (root < node and A[root] < A[leaf]):
+            A[node] += A[root]
+            A[root] = node
+            root += 1
+        else:
+            A[node] += A[leaf]
+            leaf += 1
+
+    #Phase 2: turn the parent pointers into depths of the internal nodes
+    A[n - 2] = 0
+    for node in range(n - 3, -1, -1):
+        A[node] = A[A[node]] + 1
+
+    #Phase 3: turn internal node depths into leaf depths
+    available = 1
+    used = 0
+    depth = 0
+    root = n - 2
+    node = n - 1
+    while available > 0:
+        while root >= 0 and A[root] == depth:
+            used += 1
+            root -= 1
+        while available > used:
+            A[node] = depth
+            node -= 1
+            available -= 1
+        available = 2 * used
+        depth += 1
+        used = 0
+
+    if maxLength is not None:
+        LimitCodeLengths(A, maxLength)
+    return dict(zip(chars, A))
+
+def LimitCodeLengths(lengths, maxLength):
+    #Cuts the code lengths down so none is longer than maxLength
+    #lengths must be ordered from the least to the most frequent character
+    #Codes are clamped to maxLength, then the least frequent codes that are still
+    #short enough are made one bit longer until the Kraft sum fits again,
+    #then any room left over is handed back to the most frequent characters
+    n = len(lengths)
+    if n > (1 << maxLength):
+        raise ValueError(f"{n} characters cannot all have codes of at most {maxLength} bits")
+    if max(lengths) <= maxLength:
+        return lengths
+
+    capacity = 1 << maxLength
+    for i in range(n):
+        lengths[i] = min(lengths[i], maxLength)
+    kraft = sum(1 << (maxLength - length) for length in lengths)
+
+    #Lengths never increase from one character to the next,
+    #so the first code shorter than maxLength is the cheapest one to lengthen
+    i = 0
+    while kraft > capacity:
+        while lengths[i] == maxLength:
+            i += 1
+        kraft -= 1 << (maxLength - lengths[i] - 1)
+        lengths[i] += 1
+
+    for i in range(n - 1, -1, -1):
+        while lengths[i] > 1 and kraft + (1 << (maxLength - lengths[i])) <= capacity:
+            kraft += 1 << (maxLength - lengths[i])
+            lengths[i] -= 1
+    return lengths
+
+def CanonicalCodes(codeLengths):
+    #Assigns canonical Huffman codes from the code lengths alone
+    #Characters are sorted by (length, char) and each one gets the next
+    #code in counting order, shifted left whenever the length grows
+    #so only the lengths need to be stored to rebuild the codes
+    codes = {}
+    code = 0
+    previousLength = 0
+    for char in sorted(codeLengths, key=lambda char: (codeLengths[char], char)):
+        length = codeLengths[char]
+        code <<= length - previousLength
+        codes[char] = format(code, f"0{length}b")
+        code += 1
+        previousLength = length
+    return codes
+
+def TreeFromLengths(codeLengths):
+    #Builds the HuffmanTree of the canonical code for {symbol: code length}
+    return TreeFromCodes(CanonicalCodes(codeLengths))
+
+def CountBytes(data, freq=None):
+    #Counts the bytes of a bytes-like object
+    #The symbols are the byte values 0 to 255
+    if freq is None:
+        freq = {}
+    for byte, count in Counter(data).items():
+        freq[byte] = freq.get(byte, 0) + count
+    return freq
+
+def CountContextFrequency(text, freq, previous=None):
+    #Counts the (previous symbol, symbol) pairs of text into freq
+    #previous is the symbol just before text, None at the start of a file
+    #Returns the last symbol of text so the next chunk can carry on from it
+    if not len(text):
+        return previous
+    MergeFrequency(freq, Counter(zip(chain((previous,), text[:-1]), text)))
+    return text[-1]
+
+def ContextSymbolFrequency(pairFrequency):
+    #Turns (previous symbol, symbol) counts back into plain symbol counts
+    frequency = {}
+    for (previous, char), count in pairFrequency.items():
+        frequency[char] = frequency.get(char, 0) + count
+    return frequency
+
+def BuildContextModel(pairFrequency, maxCodeLength=MAX_CODE_LENGTH):
+    #Builds an order-1 model from (previous symbol, symbol) counts
+    #The fallback table covers every symbol and is used for the first symbol and
+    #after any symbol without a table of its own
+    #A context gets its own table when the symbols after it take fewer bytes with it
+    #(counting the stored table) than with the fallback, so rare contexts share the fallback
+    #Returns the model as a list of tables: [fallback lengths, tuple of contexts, lengths for each context]
+    fallback = BuildCodeLengths(ContextSymbolFrequency(pairFrequency), maxCodeLength)
+    contextFrequency = {}
+    for (previous, char), count in pairFrequency.items():
+        if previous is not None:
+            contextFrequency.setdefault(previous, {})[char] = count
+
+    contexts = []
+    contextTables = []
+    for context in sorted(contextFrequency):
+        frequency = contextFrequency[context]
+        codeLengths = BuildCodeLengths(frequency, maxCodeLength)
+        if EstimateBytes(frequency, codeLengths, len(PackTable(codeLengths))) < EstimateBytes(frequency, fallback):
+            contexts.append(context)
+            contextTables.append(codeLengths)
+    return [fallback, tuple(contexts)] + contextTables
+
+def EstimateContextBytes(pairFrequency, model):
+    #Returns the number of bytes the counted pairs take when encoded with an order-1 model
+    fallback = model[0]
+    tables = dict(zip(model[1], model[2:]))
+    bits = 0
+    for (previous, char), count in pairFrequency.items():
+        bits += count * tables.get(previous, fallback)[char]
+    return (bits + 7) // 8
+
+class ContextEncoder:
+    #This class encodes text (or bytes) with an order-1 model
+    #Each symbol is encoded with the code table of the symbol before it
+    #It remembers the last symbol so a file can be encoded a chunk at a time,
+    #call Reset() before starting a new file or block
+    #Each encoder has
+        #codes -> (context, symbol) to the bitarray of its code, the fallback table has context None
+        #contexts -> every symbol with its own table mapped to itself
+        #previous -> the last symbol encoded, None at the start of a file or block
+    def __init__(self, model):
+        self.codes = {}
+        for char, code in CanonicalCodes(model[0]).items():
+            self.codes[(None, char)] = bitarray(code)
+        for context, codeLengths in zip(model[1], model[2:]):
+            for char, code in CanonicalCodes(codeLengths).items():
+                self.codes[(context, char)] = bitarray(code)
+        self.contexts = {context: context for context in model[1]}
+        self.previous = None
+
+    def Reset(self, previous=None):
+        #previous carries on from the end of an earlier chunk of the same file
+        self.previous = previous
+
+    def __call__(self, text):
+        encodedBits = bitarray()
+        if not len(text):
+            return encodedBits
+        previous = chain((self.previous,), text[:-1])
+        encodedBits.encode(self.codes, zip(map(self.contexts.get, previous), text))
+        self.previous = text[-1]
+        return encodedBits
+
+def ReadChunks(filepath, chunkSize=CHUNK_SIZE, mode="text"):
+    #Yields the contents of a file chunkSize symbols at a time
+    #In text mode the chunks are strings, in bytes mode they are memoryviews of
+    #a single buffer that is reused with readinto, so each chunk is only good
+    #until the next one is read
+    if mode == "bytes":
+        buffer = bytearray(chunkSize)
+        view = memoryview(buffer)
+        with open(filepath, "rb") as infile:
+            while True:
+                size = infile.readinto(buffer)
+                if not size:
+                    break
+                yield view[:size]
+        return
+
+    with open(filepath, "r", encoding="utf-8") as infile:
+        while True:
+            chunk = infile.read(chunkSize)
+            if not chunk:
+                break
+            yield chunk
+
+def ResolveBackend(backend):
+    #Backends decide how characters are counted and encoded
+        #"python" -> CountFrequency and bitarray's encoder
+        #"numpy" -> np.bincount counting and the NumPy encoder
+        #"auto" -> np.bincount counting and bitarray's encoder, which is the fastest mix (see Benchmark.py)
+    #Without NumPy installed "numpy" and "auto" fall back to "python"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    if not HuffmanNumpy.Available():
+        return "python"
+    return backend
+
+def ResolveMode(mode):
+    #"text" reads files as UTF-8, "bytes" reads them as raw bytes
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+    return mode
+
+def FrequencyCounter(backend, mode="text"):
+    #Returns the counting function for a resolved backend and mode
+    if mode == "bytes":
+        return CountBytes if backend == "python" else CountBytesNumpy
+    return CountFrequency if backend == "python" else CountFrequencyNumpy
+
+def BuildEncoder(codeTable, backend="python"):
+    #Returns a function that encodes text into a bitarray
+    if backend == "numpy":
+        return NumpyEncoder(codeTable)
+    encodeTable = {char: bitarray(code) for char, code in codeTable.items()}
+    def Encode(text):
+        encodedBits = bitarray()
+        encodedBits.encode(encodeTable, text)
+        return encodedBits
+    return Encode
+
+def CountFileFrequency(filepath, chunkSize=CHUNK_SIZE, backend="python", mode="text", order=0):
+    #Counts the symbols of one file a chunk at a time
+    #With order 1 the (previous symbol, symbol) pairs are counted instead
+    countFrequency = FrequencyCounter(backend, mode)
+    frequency = {}
+    previous = None
+    for chunk in ReadChunks(filepath, chunkSize, mode):
+        if order == 1:
+            previous = CountContextFrequency(chunk, frequency, previous)
+        else:
+            countFrequency(chunk, frequency)
+    return frequency
+
+def MergeFrequency(total, frequency):
+    #Adds the counts in frequency to total
+    #Merging the files in order keeps the same character order as counting them one after another
+    for char, count in frequency.items():
+        total[char] = total.get(char, 0) + count
+    return total
+
+def EstimateBits(frequency, codeLengths):
+    #Returns the number of bits frequency would take with these code lengths
+    #or None if a symbol has no code
+    bits = 0
+    for char, count in frequency.items():
+        length = codeLengths.get(char)
+        if length is None:
+            return None
+        bits += count * length
+    return bits
+
+def EstimateBytes(frequency, codeLengths, tableCost=0):
+    #Same as EstimateBits but in bytes, the payload is padded to a whole byte
+    #tableCost is added on for a table only this file would use
+    bits = EstimateBits(frequency, codeLengths)
+    if bits is None:
+        return None
+    return (bits + 7) // 8 + tableCost
+
+def ChooseTables(fileFrequencies, maxCodeLength=MAX_CODE_LENGTH):
+    #Decides which files share a code table and which get their own
+    #A file gets its own table when its payload plus the stored table is smaller
+    #than its payload under the table built from every file
+    #The shared table is then rebuilt from just the files still using it
+    #Returns (list of {symbol: code length}, table index of each file)
+    total = {}
+    for frequency in fileFrequencies:
+        MergeFrequency(total, frequency)
+    sharedLengths = BuildCodeLengths(total, maxCodeLength)
+
+    ownLengths = []
+    for frequency in fileFrequencies:
+        lengths = None
+        if frequency:
+            candidate = BuildCodeLengths(frequency, maxCodeLength)
+            ownBytes = EstimateBytes(frequency, candidate, len(PackTable(candidate)))
+            if ownBytes < EstimateBytes(frequency, sharedLengths):
+                lengths = candidate
+        ownLengths.append(lengths)
+
+    shared = {}
+    for frequency, lengths in zip(fileFrequencies, ownLengths):
+        if lengths is None:
+            MergeFrequency(shared, frequency)
+
+    tables = [BuildCodeLengths(shared, maxCodeLength)] if shared else []
+    tableIndexes = []
+    for lengths in ownLengths:
+        if lengths is None:
+            #Empty files decode nothing so any table will do for them
+            tableIndexes.append(0)
+        else:
+            tableIndexes.append(len(tables))
+            tables.append(lengths)
+    return tables, tableIndexes
+
+def StoredSize(frequency, mode="text"):
+    #Returns the size in bytes of a file kept as it is (UTF-8 for text)
+    if mode == "bytes":
+        return sum(frequency.values())
+    return sum(count * len(char.encode("utf-8")) for char, count in frequency.items())
+
+def ChooseMethods(fileFrequencies, tableLengths, tableIndexes, mode="text", tableCosts=None):
+    #Picks METHOD_HUFFMAN or METHOD_STORED for every file
+    #A file is stored when its exact Huffman payload would be no smaller than the file
+    #(or its table has no code for one of its symbols)
+    #Tables no file uses any more are dropped, and if the Huffman files together with
+    #their tables still come out bigger than storing them then every file is stored
+    #tableCosts is the number of bytes each table takes in the archive, worked out if not given
+    #Returns (method of each file, list of {symbol: code length}, table index of each file)
+    if tableCosts is None:
+        tableCosts = [len(PackTable(codeLengths)) for codeLengths in tableLengths]
+    methods = []
+    for frequency, tableIndex in zip(fileFrequencies, tableIndexes):
+        encodedBytes = EstimateBytes(frequency, tableLengths[tableIndex])
+        if encodedBytes is not None and encodedBytes < StoredSize(frequency, mode):
+            methods.append(METHOD_HUFFMAN)
+        else:
+            methods.append(METHOD_STORED)
+
+    used = sorted({tableIndex for tableIndex, method in zip(tableIndexes, methods) if method == METHOD_HUFFMAN})
+    huffmanBytes = sum(tableCosts[tableIndex] for tableIndex in used)
+    storedBytes = 0
+    for frequency, tableIndex, method in zip(fileFrequencies, tableIndexes, methods):
+        if method == METHOD_HUFFMAN:
+            huffmanBytes += EstimateBytes(frequency, tableLengths[tableIndex])
+            storedBytes += StoredSize(frequency, mode)
+    if huffmanBytes >= storedBytes:
+        methods = [METHOD_STORED] * len(methods)
+        used = []
+
+    newIndex = {tableIndex: position for position, tableIndex in enumerate(used)}
+    tables = [tableLengths[tableIndex] for tableIndex in used]
+    tableIndexes = [newIndex[tableIndex] if method == METHOD_HUFFMAN else 0
+                    for tableIndex, method in zip(tableIndexes, methods)]
+    return methods, tables, tableIndexes
+
+def ResolveTableMode(tables):
+    if tables not in TABLE_MODES:
+        raise ValueError(f"Unknown table mode {tables}, expected one of {TABLE_MODES}")
+    return tables
+
+def ChooseContextMethods(fileFrequencies, model, mode="text"):
+    #Same as ChooseMethods for files encoded with an order-1 model
+    #Returns (method of each file, the model's tables or an empty list if every file is stored)
+    methods = []
+    huffmanBytes = sum(len(PackTable(table)) for table in model)
+    storedBytes = 0
+    for frequency in fileFrequencies:
+        encodedBytes = EstimateContextBytes(frequency, model)
+        fileStoredBytes = StoredSize(ContextSymbolFrequency(frequency), mode)
+        if encodedBytes < fileStoredBytes:
+            methods.append(METHOD_ORDER1)
+            huffmanBytes += encodedBytes
+            storedBytes += fileStoredBytes
+        else:
+            methods.append(METHOD_STORED)
+    if huffmanBytes >= storedBytes:
+        return [METHOD_STORED] * len(methods), []
+    return methods, model
+
+def ResolveOrder(order, tables):
+    if order not in ORDERS:
+        raise ValueError(f"Unknown order {order}, expected one of {ORDERS}")
+    if order == 1 and tables != "shared":
+        raise ValueError("Order 1 uses one model for every file, tables must be 'shared'")
+    return order
+
+def TrainDictionary(samplePaths, outputPath=None, mode="text", maxCodeLength=MAX_CODE_LENGTH, chunkSize=CHUNK_SIZE, backend="auto"):
+    #Builds a code table from sample files and saves it as a dictionary
+    #so archives of similar files can refer to it instead of storing their own table
+    #outputPath defaults to the dictionary's ID with DICTIONARY_EXTENSION in the current directory
+    #Files with symbols the samples did not have are stored rather than encoded
+    #Returns the Dictionary, which is loaded and ready to use
+    backend = ResolveBackend(backend)
+    mode = ResolveMode(mode)
+    frequency = {}
+    for filepath in samplePaths:
+        MergeFrequency(frequency, CountFileFrequency(filepath, chunkSize, backend, mode))
+    if not frequency:
+        raise ValueError("No data found in the sample files")
+    codeLengths = BuildCodeLengths(frequency, maxCodeLength)
+    if outputPath is None:
+        outputPath = DictionaryId(codeLengths).hex() + DICTIONARY_EXTENSION
+    SaveDictionary(outputPath, codeLengths)
+    return LoadDictionary(outputPath)
+
+def ResolveDictionary(dictionary, mode, tables, order):
+    #Loads the dictionary Compress was given (a path or a loaded Dictionary)
+    if dictionary is None:
+        return None
+    if isinstance(dictionary, str):
+        dictionary = LoadDictionary(dictionary)
+    if tables != "shared" or order != 0:
+        raise ValueError("A dictionary is one shared order-0 table, tables must be 'shared' and order 0")
+    dictionaryMode = "bytes" if any(isinstance(symbol, int) for symbol in dictionary.codeLengths) else "text"
+    if dictionaryMode != mode:
+        raise ValueError(f"Dictionary {dictionary.Name()} was trained in {dictionaryMode} mode, not {mode}")
+    return dictionary
+
+def ResolveWorkers(workers):
+    #None means use every CPU
+    if workers is None:
+        return os.cpu_count() or 1
+    return max(1, workers)
+
+def BoundedMap(executor, func, argsList, limit):
+    #Like executor.map but keeps at most limit tasks in flight
+    #so finished results do not pile up in memory while we write them out
+    pending = deque()
+    for args in argsList:
+        pending.append(executor.submit(func, *args))
+        if len(pending) >= limit:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def BuildEncoders(tableLengths, backend="python", order=0):
+    #Returns the encoder for each table index an entry can refer to
+    #An order-1 model takes up several tables but only its first index is used
+    #Order-1 encoding always uses bitarray, whatever the backend
+    if order == 1:
+        return [ContextEncoder(tableLengths)] if tableLengths else []
+    return [CachedEncoder(codeLengths, backend) for codeLengths in tableLengths]
+
+def CachedEncoder(codeLengths, backend="python"):
+    #Returns the encoder for a table of code lengths, reusing one built earlier if there is one
+    return tableCache.Get(("encode", backend), codeLengths, lambda: BuildEncoder(CanonicalCodes(codeLengths), backend))
+
+def CachedDecodeTable(codeTable):
+    #Returns the DecodeTable for a code table, reusing one built earlier if there is one
+    return tableCache.Get("decode", codeTable, lambda: DecodeTable(codeTable))
+
+def ResetEncoder(encode, previous=None):
+    #Order-1 encoders remember the last symbol, so start them afresh for a new file or block
+    #(or from previous, the last symbol before a chunk in the middle of a file)
+    if isinstance(encode, ContextEncoder):
+        encode.Reset(previous)
+
+#Encoders of a worker process (one per code table), set by InitEncodeWorker
+workerEncoders = None
+
+def InitEncodeWorker(tableLengths, backend, order=0):
+    global workerEncoders
+    workerEncoders = BuildEncoders(tableLengths, backend, order)
+
+def EncodeBlock(encode, text):
+    #Encodes text as one block
+    #Returns (packed bytes, bit length, symbol count)
+    ResetEncoder(encode)
+    encodedBits = encode(text)
+    return encodedBits.tobytes(), len(encodedBits), len(text)
+
+def EncodeBlockWorker(text, tableIndex=0):
+    return EncodeBlock(workerEncoders[tableIndex], text)
+
+def EncodeChunkWorker(text, tableIndex=0, previous=None):
+    #Encodes one chunk of a file in a worker process, carrying on from previous
+    #(the symbol before the chunk, only used by order-1 encoders)
+    #Returns (packed bytes, bit length), the bits are not padded out when they are written
+    encode = workerEncoders[tableIndex]
+    ResetEncoder(encode, previous)
+    encodedBits = encode(text)
+    return encodedBits.tobytes(), len(encodedBits)
+
+def UnpackBits(data, bitLength):
+    #Turns (packed bytes, bit length) back into a bitarray of just those bits
+    bits = bitarray()
+    bits.frombytes(data)
+    del bits[bitLength:]
+    return bits
+
+def WriteStoredEntry(writer, filepath, chunkSize=CHUNK_SIZE, mode="text"):
+    #Copies a file into the archive as a stored entry
+    writer.BeginEntry(os.path.basename(filepath), 0, METHOD_STORED)
+    symbolCount = 0
+    for chunk in ReadChunks(filepath, chunkSize, mode):
+        writer.WriteStored(chunk.encode("utf-8") if mode == "text" else chunk)
+        symbolCount += len(chunk)
+    writer.EndEntry(symbolCount, os.path.getsize(filepath))
+
+def RecordEntry(stats, entry):
+    #Adds the numbers of an entry that was just written to stats
+    stats.AddFile(entry.name, METHOD_NAMES[entry.method], entry.originalSize, entry.byteLength, entry.symbolCount)
+
+def EncodeBlocksParallel(executor, writer, inputFilepaths, blockSize, limit, mode="text", tableIndexes=None, methods=None, stats=NULL_STATS, blocks=True):
+    #Splits every file into blocks and encodes them in the process pool
+    #Entries are written in order, keeping at most limit steps queued up
+    #so no more than limit blocks are held in memory at once
+    #tableIndexes gives the code table of each file (all 0 if not given)
+    #and methods says which files are stored rather than encoded
+    #Without blocks the pieces are chunks of one continuous run of bits, written
+    #unpadded one after another, so the archive is the same as the serial path's
+    #Each finished entry is recorded in stats
+    if tableIndexes is None:
+        tableIndexes = [0] * len(inputFilepaths)
+    if methods is None:
+        methods = [METHOD_HUFFMAN] * len(inputFilepaths)
+    pending = deque()
+
+    def Flush(limit):
+        while len(pending) > limit:
+            action, value = pending.popleft()
+            if action == "begin":
+                writer.BeginEntry(*value)
+            elif action == "block":
+                writer.WriteBlock(*value.result())
+            elif action == "chunk":
+                writer.WriteBits(UnpackBits(*value.result()))
+            elif action == "stored":
+                WriteStoredEntry(writer, value, blockSize, mode)
+                RecordEntry(stats, writer.entries[-1])
+            else:
+                writer.EndEntry(*value)
+                RecordEntry(stats, writer.entries[-1])
+
+    for filepath, tableIndex, method in zip(inputFilepaths, tableIndexes, methods):
+        if method == METHOD_STORED:
+            pending.append(("stored", filepath))
+            Flush(limit)
+            continue
+        pending.append(("begin", (os.path.basename(filepath), tableIndex, method)))
+        symbolCount = 0
+        previous = None
+        for block in ReadChunks(filepath, blockSize, mode):
+            if mode == "bytes":
+                block = bytes(block) #The read buffer gets reused, so send the worker a copy
+            if blocks:
+                pending.append(("block", executor.submit(EncodeBlockWorker, block, tableIndex)))
+            else:
+                pending.append(("chunk", executor.submit(EncodeChunkWorker, block, tableIndex, previous)))
+                previous = block[-1]
+            symbolCount += len(block)
+            Flush(limit)
+        pending.append(("end", (symbolCount, os.path.getsize(filepath))))
+    Flush(0)
+
+def OpenOutput(output):
+    #Opens a path for writing in binary, a file object that is already open
+    #(like sys.stdout.buffer) is written to as it is and left open
+    if hasattr(output, "write"):
+        return nullcontext(output)
+    return open(output, "wb")
+
+def Compress(inputFilepaths, outputFilepath = "compressed.bin", chunkSize=CHUNK_SIZE, workers=1, blockSize=None, backend="auto", maxCodeLength=MAX_CODE_LENGTH, mode="text", tables="shared", allowStored=True, order=0, dictionary=None, stats=None):
     #This will encode the contents of all the inputed files
-    #The output file will contain a pickled dictionary with two keys
-        #codeTable -> the Huffman codes mapping char to binary string
-        #encodedData -> the compressed bitarray of the input texts
-
-    allText = ""
-    for filepath in inputFilepaths:
-        with open(filepath, "r", encoding="utf-8") as infile:
-            allText += infile.read()
-    
-    if not allText:
+    #outputFilepath can also be a binary file object, the archive is written in one pass so pipes work
+    #Files are read chunkSize characters at a time so memory use
+    #depends on the chunk size rather than the size of the input
+    #The output file is a binary archive (see HuffmanArchive.py) holding
+    #the canonical code lengths followed by the packed bits of every file
+    #With workers > 1 (or None for every CPU) files are counted and encoded
+    #in a process pool a chunk at a time, the output is the same as the serial path
+    #With blockSize set every file is split into blocks of that many characters
+    #which can be encoded and decoded on their own, so even a single huge file
+    #uses every worker and readers can start decoding at any block
+    #backend picks how characters are counted and encoded ("auto", "python" or "numpy")
+    #maxCodeLength caps the length of any code (None for no limit)
+    #mode "bytes" reads files as raw bytes with the 256 byte values as the alphabet
+    #so any file can be compressed and is restored byte for byte
+    #tables "shared" uses one code table for every file, "auto" gives a file its own
+    #table whenever that is estimated to make the archive smaller (see ChooseTables)
+    #With allowStored files that Huffman coding would not shrink are kept as they are
+    #(see ChooseMethods), so tiny or incompressible files never grow by more than a directory entry
+    #order 1 encodes every symbol with a code table picked by the symbol before it
+    #(see BuildContextModel), which suits natural language text better but is slower
+    #dictionary (a path or a Dictionary from TrainDictionary) encodes every file with that
+    #dictionary's table and only stores its ID, Decompress needs the dictionary loaded to read it
+    #stats (a JobStats from HuffmanStats.py, or a callback for a new one) is filled in with
+    #the time of every phase and the numbers of every file, and returned
+    workers = ResolveWorkers(workers)
+    backend = ResolveBackend(backend)
+    mode = ResolveMode(mode)
+    tables = ResolveTableMode(tables)
+    order = ResolveOrder(order, tables)
+    dictionary = ResolveDictionary(dictionary, mode, tables, order)
+    countFrequency = FrequencyCounter(backend, mode)
+    stats = ResolveStats(stats)
+    stats.Start("compress")
+
+    #First pass: build the frequency table of each of the texts
+    fileFrequencies = []
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as executor, stats.Phase("count"):
+            fileFrequencies = list(executor.map(CountFileFrequency, inputFilepaths, repeat(chunkSize), repeat(backend), repeat(mode), repeat(order)))
+    else:
+        for filepath in inputFilepaths:
+            frequency = {}
+            previous = None
+            for chunk in stats.TimeIter("read", ReadChunks(filepath, chunkSize, mode)):
+                with stats.Phase("count"):
+                    if order == 1:
+                        previous = CountContextFrequency(chunk, frequency, previous)
+                    else:
+                        countFrequency(chunk, frequency)
+            fileFrequencies.append(frequency)
+    stats.PhaseDone("count")
+
+    if not any(fileFrequencies):
         print("No data found int he selected files.")
         return
 
-    #This will build the tree based on the frequency of all the texts
-    frequency = CountFrequency(allText)
-    tree = BuildHuffmanTree(frequency)
-    codeTable = GenerateHuffmanCodes(tree)
-
-    encodedFiles = []
-    for filepath in inputFilepaths:
-        with open(filepath, "r", encoding="utf-8") as infile:
-            text = infile.read()
-        encodedString = "".join(codeTable[ch] for ch in text)
-        encodedBits = bitarray(encodedString)
-        file_entry = {
-            "f": os.path.basename(filepath), #f for filename
-            "d": encodedBits                 #d for data
-        }
-        encodedFiles.append(file_entry)
-
-    outputData = {
-        "t": codeTable,         #t for tree
-        "e": encodedFiles       #e for encoded files
-    }
-    with open(outputFilepath, "wb") as outfile:
-        pickle.dump(outputData, outfile)
-
-def Decompress(inputFilepath="compressed.bin", outputDir="decompressed_files"):
-    #This takes a .bin file produced by the Encode function and converts it back into multiple text files
-    #The file should contain a pickled dictionary with:
+    #Work out the code lengths from the frequencies
+    #then give out canonical codes of those lengths
+    tablesStarted = time.perf_counter()
+    tableCosts = None
+    if dictionary is not None:
+        tableLengths, tableIndexes = [dictionary.codeLengths], [0] * len(inputFilepaths)
+        tableCosts = [len(PackTable(DictionaryRef(dictionary.id)))]
+        if not allowStored:
+            for filepath, frequency in zip(inputFilepaths, fileFrequencies):
+                if EstimateBits(frequency, dictionary.codeLengths) is None:
+                    raise ValueError(f"{filepath} has symbols that are not in dictionary {dictionary.Name()}")
+    elif order == 1:
+        frequency = {}
+        for fileFrequency in fileFrequencies:
+            MergeFrequency(frequency, fileFrequency)
+        tableLengths, tableIndexes = BuildContextModel(frequency, maxCodeLength), [0] * len(inputFilepaths)
+    elif tables == "auto":
+        tableLengths, tableIndexes = ChooseTables(fileFrequencies, maxCodeLength)
+    else:
+        frequency = {}
+        for fileFrequency in fileFrequencies:
+            MergeFrequency(frequency, fileFrequency)
+        tableLengths, tableIndexes = [BuildCodeLengths(frequency, maxCodeLength)], [0] * len(inputFilepaths)
+    methods = [METHOD_ORDER1 if order == 1 else METHOD_HUFFMAN] * len(inputFilepaths)
+    if allowStored and order == 1:
+        methods, tableLengths = ChooseContextMethods(fileFrequencies, tableLengths, mode)
+    elif allowStored:
+        methods, tableLengths, tableIndexes = ChooseMethods(fileFrequencies, tableLengths, tableIndexes, mode, tableCosts)
+    #A dictionary's table is written as a reference to it
+    archiveTables = tableLengths
+    if dictionary is not None:
+        archiveTables = [DictionaryRef(dictionary.id) for codeLengths in tableLengths]
+    stats.AddTime("tables", time.perf_counter() - tablesStarted)
+    stats.PhaseDone("tables")
+
+    #Second pass: encode each file a chunk at a time and write it out straight away
+    with OpenOutput(outputFilepath) as outfile:
+        writer = ArchiveWriter(outfile, archiveTables, FLAG_BYTES if mode == "bytes" else 0)
+        stats.tableBytes = writer.position
+        if workers > 1:
+            #Reading, encoding and pickling happen in the workers so they are timed together
+            with ProcessPoolExecutor(workers, initializer=InitEncodeWorker, initargs=(tableLengths, backend, order)) as executor, stats.Phase("encode"):
+                EncodeBlocksParallel(executor, writer, inputFilepaths, blockSize or chunkSize, 2 * workers, mode,
+                                     tableIndexes, methods, stats, blocks=bool(blockSize))
+        else:
+            with stats.Phase("tables"):
+                encoders = BuildEncoders(tableLengths, backend, order)
+            for filepath, tableIndex, method in zip(inputFilepaths, tableIndexes, methods):
+                if method == METHOD_STORED:
+                    with stats.Phase("write"):
+                        WriteStoredEntry(writer, filepath, chunkSize, mode)
+                    RecordEntry(stats, writer.entries[-1])
+                    continue
+                encode = encoders[tableIndex]
+                ResetEncoder(encode)
+                writer.BeginEntry(os.path.basename(filepath), tableIndex, method)
+                symbolCount = 0
+                for chunk in stats.TimeIter("read", ReadChunks(filepath, blockSize or chunkSize, mode)):
+                    with stats.Phase("encode"):
+                        encoded = EncodeBlock(encode, chunk) if blockSize else encode(chunk)
+                    with stats.Phase("write"):
+                        if blockSize:
+                            writer.WriteBlock(*encoded)
+                        else:
+                            writer.WriteBits(encoded)
+                    symbolCount += len(chunk)
+                writer.EndEntry(symbolCount, os.path.getsize(filepath))
+                RecordEntry(stats, writer.entries[-1])
+        stats.PhaseDone("encode")
+        writer.Close()
+
+    if stats.enabled:
+        stats.bytesIn = sum(entry.originalSize for entry in writer.entries)
+        stats.bytesOut = writer.position
+        stats.symbols = sum(entry.symbolCount for entry in writer.entries)
+        stats.codeTables = [codeLengths for codeLengths in tableLengths if isinstance(codeLengths, dict)]
+        stats.tables = [len(codeLengths) for codeLengths in stats.codeTables]
+        stats.Finish()
+        return stats
+
+#The only globals an older pickled archive refers to, anything else is refused
+#so opening a crafted file cannot run code
+LEGACY_GLOBALS = {("bitarray", "bitarray"), ("bitarray._bitarray", "_bitarray_reconstructor")}
+PICKLE_PROTOCOL_HEADER = b"\x80" #PROTO opcode that starts every pickle of protocol 2 or later
+
+class LegacyUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) not in LEGACY_GLOBALS:
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed in an archive")
+        return pickle.Unpickler.find_class(self, module, name)
+
+def LoadLegacy(infile):
+    #Returns the dictionary of an older pickled archive
+    #Raises ValueError for anything else, including junk and truncated files
+    if infile.read(len(PICKLE_PROTOCOL_HEADER)) != PICKLE_PROTOCOL_HEADER:
+        raise ValueError("Not a Huffman archive")
+    infile.seek(0)
+    try:
+        data = LegacyUnpickler(infile).load()
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, KeyError, TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Not a Huffman archive") from None
+    if not isinstance(data, dict) or "t" not in data or "e" not in data:
+        raise ValueError("Not a Huffman archive")
+    return data
+
+def IterLegacyFiles(infile):
+    #Yields (filename, chunks) for the older pickle based format,
+    #a single pickled dictionary with:
         #"t": the global Huffman code table (from the global tree)
         #"e": a list of file entries, where each entry is a dictionary with:
             #"f": the original filename
             #"d": the encoded bitarray data
-    #The decoded text is written to outputFilepath
+    data = LoadLegacy(infile)
+    decodeTable = CachedDecodeTable(data["t"])
 
-    allContents = ""
-    
+    for file_entry in data["e"]:
+        encodedBits = file_entry["d"]
+        yield file_entry["f"], IterDecodeBits(encodedBits.tobytes(), len(encodedBits), decodeTable)
+
+def IterArchiveFiles(inputFilepath):
+    #This yields (filename, chunks) for every file in a .bin file
+    #where chunks is a generator of the decoded text of that file
+    #Each chunks generator must be used up before moving on to the next file
+    with ArchiveReader(inputFilepath) as reader:
+        if not reader.IsArchive():
+            with open(inputFilepath, "rb") as infile:
+                yield from IterLegacyFiles(infile)
+            return
+
+        for entry in reader.Entries():
+            yield entry.name, IterEntryChunks(reader, entry)
+
+def ReaderCodeLengths(reader, tableIndex):
+    #Returns {symbol: code length} for one of the tables of an open ArchiveReader
+    #looking up the dictionary for tables that refer to one
+    table = reader.Tables()[tableIndex]
+    if isinstance(table, DictionaryRef):
+        return FindDictionary(table.id).codeLengths
+    return table
+
+def ReaderDecodeTable(reader, tableIndex):
+    #Returns the decode table for one of the code tables of an open ArchiveReader
+    #Tables come from the shared table cache, so archives (and dictionaries) with
+    #the same table reuse one, and the reader keeps its own so it only looks once
+    key = ("decode", tableIndex)
+    if key not in reader.cache:
+        codeLengths = ReaderCodeLengths(reader, tableIndex)
+        reader.cache[key] = tableCache.Get("decode", codeLengths, lambda: DecodeTable(CanonicalCodes(codeLengths)))
+    return reader.cache[key]
+
+def StoredText(reader, data):
+    #Returns the contents of a stored payload, bytes in bytes archives and text otherwise
+    if reader.Flags() & FLAG_BYTES:
+        return bytes(data)
+    return str(data, "utf-8")
+
+def ReaderContextTables(reader, tableIndex):
+    #Returns (fallback DecodeTable, {context: DecodeTable}) for the order-1 model
+    #starting at tableIndex of an open ArchiveReader, built the first time it is needed
+    #Contexts are keyed by what the decoder outputs, so byte values become single bytes
+    key = ("context", tableIndex)
+    if key not in reader.cache:
+        tables = reader.Tables()
+        fallback = DecodeTable(CanonicalCodes(tables[tableIndex]), multi=False)
+        contexts = {}
+        for context, codeLengths in zip(tables[tableIndex + 1], tables[tableIndex + 2:]):
+            if isinstance(context, int):
+                context = bytes((context,))
+            contexts[context] = DecodeTable(CanonicalCodes(codeLengths), multi=False)
+        reader.cache[key] = fallback, contexts
+    return reader.cache[key]
+
+def IterStoredChunks(reader, data, chunkSize=CHUNK_SIZE):
+    #Yields a stored payload a chunk at a time
+    if reader.Flags() & FLAG_BYTES:
+        for start in range(0, len(data), chunkSize):
+            yield bytes(data[start:start + chunkSize])
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for start in range(0, len(data), chunkSize):
+        yield decoder.decode(data[start:start + chunkSize], start + chunkSize >= len(data))
+
+def DecodeBlock(reader, method, tableIndex, data, bitLength):
+    #Returns the decoded text of one block of an entry
+    if method == METHOD_STORED:
+        return StoredText(reader, data)
+    if method == METHOD_ORDER1:
+        return DecodeContextBits(data, bitLength, *ReaderContextTables(reader, tableIndex))
+    return DecodeBits(data, bitLength, ReaderDecodeTable(reader, tableIndex))
+
+def IterBlockChunks(reader, method, tableIndex, data, bitLength):
+    #Yields the decoded text of one block of an entry in pieces
+    if method == METHOD_STORED:
+        return IterStoredChunks(reader, data)
+    if method == METHOD_ORDER1:
+        return IterDecodeContextBits(data, bitLength, *ReaderContextTables(reader, tableIndex))
+    return IterDecodeBits(data, bitLength, ReaderDecodeTable(reader, tableIndex))
+
+def IterEntryChunks(reader, entry, firstBlock=0):
+    #Decodes a single archive entry straight from its payload
+    #starting at block firstBlock (entries without blocks only have block 0)
+    for data, bitLength, symbolCount in islice(reader.Blocks(entry), firstBlock, None):
+        yield from IterBlockChunks(reader, entry.method, entry.tableIndex, data, bitLength)
+
+def RequireEntry(reader, member):
+    #Looks up member in the directory of an open archive
+    entry = reader.FindEntry(member)
+    if entry is None:
+        raise KeyError(f"'{member}' is not in {reader.path}")
+    return entry
+
+def ReadBlock(inputFilepath, member, blockIndex):
+    #Returns the decoded text of a single block of an archive entry
+    with ArchiveReader(inputFilepath) as reader:
+        entry = RequireEntry(reader, member)
+        block = next(islice(reader.Blocks(entry), blockIndex, None), None) if blockIndex >= 0 else None
+        if block is None:
+            raise IndexError(f"'{member}' has no block {blockIndex}")
+        data, bitLength, symbolCount = block
+        return DecodeBlock(reader, entry.method, entry.tableIndex, data, bitLength)
+
+def List(inputFilepath):
+    #Returns the ArchiveEntry of every file in a .bin file
+    #Only the footer and directory are read so this does not depend on the size of the payloads
+    #Older pickled files have no directory, so they are loaded and counted the slow way
+    with ArchiveReader(inputFilepath) as reader:
+        if reader.IsArchive():
+            return reader.Entries()
+
+    entries = []
+    for filename, chunks in IterArchiveFiles(inputFilepath):
+        symbolCount = 0
+        originalSize = 0
+        for chunk in chunks:
+            symbolCount += len(chunk)
+            originalSize += len(chunk.encode("utf-8"))
+        entries.append(ArchiveEntry(filename, symbolCount=symbolCount, originalSize=originalSize))
+    return entries
+
+def Extract(inputFilepath, member, dest=None):
+    #Decodes only the file called member from a .bin file
+    #dest can be a file path or an existing directory (defaults to the current directory)
+    #Returns the path that was written
+    if dest is None:
+        dest = "."
+    if os.path.isdir(dest):
+        dest = os.path.join(dest, CheckName(member))
+
+    with ArchiveReader(inputFilepath) as reader:
+        if reader.IsArchive():
+            WriteChunks(dest, IterEntryChunks(reader, RequireEntry(reader, member)), 0)
+            return dest
+
+    for filename, chunks in IterArchiveFiles(inputFilepath):
+        if filename == member:
+            WriteChunks(dest, chunks, 0)
+            return dest
+    raise KeyError(f"'{member}' is not in {inputFilepath}")
+
+def LoadCodeTable(inputFilepath):
+    #Returns the Huffman code table (char to binary string) of a .bin file
+    #without decoding any of the files in it
+    with ArchiveReader(inputFilepath) as reader:
+        if reader.IsArchive():
+            return CanonicalCodes(ReaderCodeLengths(reader, 0)) if reader.Tables() else None
     with open(inputFilepath, "rb") as infile:
-        data = pickle.load(infile)
+        return LoadLegacy(infile)["t"]
+
+def IterDecompress(inputFilepath="compressed.bin"):
+    #This yields (filename, chunk) pairs of decoded text (bytes for archives made in bytes mode)
+    #so callers can look at the contents without holding the whole archive
+    #Every file starts with an empty chunk ("" or b"" to match the rest), so even
+    #an empty file is seen and callers learn of a file before it is decoded
+    with ArchiveReader(inputFilepath) as reader:
+        empty = b"" if reader.IsArchive() and reader.Flags() & FLAG_BYTES else ""
+    for filename, chunks in IterArchiveFiles(inputFilepath):
+        yield filename, empty
+        for chunk in chunks:
+            yield filename, chunk
+
+def WriteChunks(outputPath, chunks, previewChars=None, stats=NULL_STATS):
+    #Writes decoded chunks to outputPath as they arrive
+    #and returns the first previewChars characters (or all of them if None)
+    #Chunks of bytes are written as they are and previewed as UTF-8
+    #Time spent writing is added to the "write" phase of stats
+    chunks = iter(chunks)
+    first = next(chunks, "")
+    binary = isinstance(first, bytes)
+    preview = []
+    previewLeft = previewChars
+    with (open(outputPath, "wb") if binary else open(outputPath, "w", encoding="utf-8")) as outfile:
+        for chunk in chain((first,), chunks):
+            with stats.Phase("write"):
+                outfile.write(chunk)
+            if previewLeft is None:
+                preview.append(chunk)
+            elif previewLeft > 0:
+                preview.append(chunk[:previewLeft])
+                previewLeft -= len(preview[-1])
+    if binary:
+        return b"".join(preview).decode("utf-8", "replace")
+    return "".join(preview)
+
+#Archive reader of a worker process, set by InitDecodeWorker
+workerReader = None
+
+def InitDecodeWorker(inputFilepath, dictionaries=()):
+    global workerReader
+    for path in dictionaries:
+        LoadDictionary(path)
+    workerReader = ArchiveReader(inputFilepath)
 
-    codeTable = data["t"]
-    encodedFiles = data["e"]
+def DecodeEntryWorker(entry, outputPath, previewChars):
+    #Decodes one archive entry to outputPath in a worker process
+    return WriteChunks(outputPath, IterEntryChunks(workerReader, entry), previewChars)
 
-    reverseCodeTable = {code: char for char, code in codeTable.items()}
+def DecodeBlockWorker(offset, byteLength, bitLength, tableIndex, method, crc, name, index):
+    #Decodes one block of an archive entry in a worker process and returns its text
+    #The block is checked against crc first (see CheckBlock)
+    data = workerReader.view[offset:offset + byteLength]
+    CheckBlock(data, crc, name, index)
+    return DecodeBlock(workerReader, method, tableIndex, data, bitLength)
+
+def VerifyEntryWorker(entry, decode):
+    return VerifyEntry(workerReader, entry, decode)
+
+def Decompress(inputFilepath="compressed.bin", outputDir="decompressed_files", previewChars=None, workers=1, dictionaries=(), stats=None):
+    #This takes a .bin file produced by the Compress function and converts it back into multiple text files
+    #Each file is written to outputDir a chunk at a time as it is decoded
+    #The return value holds each output path followed by its text
+    #If previewChars is set only that many characters of each file are kept
+    #With workers > 1 (or None for every CPU) entries are decoded in a process pool
+    #and entries written in blocks have their blocks decoded in parallel too
+    #dictionaries lists dictionary files to load for archives made with one
+    #stats works as it does for Compress, it is filled in but not returned
+    #since the return value is already the text
+
+    allContents = []
+    workers = ResolveWorkers(workers)
+    dictionaries = [dictionary.path for dictionary in map(LoadDictionary, dictionaries)]
+    stats = ResolveStats(stats)
+    stats.Start("decompress")
 
     if not os.path.exists(outputDir):
         os.makedirs(outputDir)
 
-    for file_entry in encodedFiles:
-        filename = file_entry["f"]
-        encodedBits = file_entry["d"]
+    entries = None
+    with ArchiveReader(inputFilepath) as reader, stats.Phase("open"):
+        parallel = workers > 1 and reader.IsArchive()
+        if reader.IsArchive() and (parallel or stats.enabled):
+            entries = reader.Entries()
+            stats.codeTables = [ReaderCodeLengths(reader, index) for index, table in enumerate(reader.Tables()) if not isinstance(table, tuple)]
+            stats.tables = [len(codeLengths) for codeLengths in stats.codeTables]
+            stats.tableBytes = entries[0].offset if entries else 0 #The first payload starts right after the tables
+    stats.PhaseDone("open")
+
+    if parallel:
+        outputPaths = [OutputPath(outputDir, entry.name) for entry in entries]
+        with ProcessPoolExecutor(workers, initializer=InitDecodeWorker, initargs=(inputFilepath, dictionaries)) as executor:
+            if any(entry.blocks for entry in entries):
+                #Decode the blocks in the pool and write them out in order here
+                #Stored entries have nothing to decode, so they are copied out here a chunk
+                #at a time instead of going through the pool as one whole payload
+                tasks = ((offset, byteLength, bitLength, entry.tableIndex, entry.method, entry.BlockCrc(index), entry.name, index)
+                         for entry in entries if entry.method != METHOD_STORED
+                         for index, (offset, byteLength, bitLength, symbolCount) in enumerate(entry.IterBlocks()))
+                results = BoundedMap(executor, DecodeBlockWorker, tasks, 2 * workers)
+                with ArchiveReader(inputFilepath) as reader:
+                    for entry, outputPath in zip(entries, outputPaths):
+                        if entry.method == METHOD_STORED:
+                            chunks = IterEntryChunks(reader, entry)
+                        else:
+                            chunks = (next(results) for _ in range(max(1, len(entry.blocks))))
+                        preview = WriteChunks(outputPath, stats.TimeIter("decode", chunks), previewChars, stats)
+                        allContents.append(outputPath + "\n" + preview + "\n\n")
+                        RecordOutput(stats, outputPath, entry)
+            else:
+                #Whole entries are decoded and written in the workers so they are timed together
+                tasks = ((entry, outputPath, previewChars) for entry, outputPath in zip(entries, outputPaths))
+                with stats.Phase("decode"):
+                    for entry, outputPath, preview in zip(entries, outputPaths, BoundedMap(executor, DecodeEntryWorker, tasks, 2 * workers)):
+                        allContents.append(outputPath + "\n" + preview + "\n\n")
+                        RecordOutput(stats, outputPath, entry)
+    else:
+        for index, (filename, chunks) in enumerate(IterArchiveFiles(inputFilepath)):
+            outputPath = OutputPath(outputDir, filename)
+            preview = WriteChunks(outputPath, stats.TimeIter("decode", chunks), previewChars, stats)
+            allContents.append(outputPath + "\n" + preview + "\n\n")
+            RecordOutput(stats, outputPath, entries[index] if entries else ArchiveEntry(filename))
+    stats.PhaseDone("decode")
+
+    if stats.enabled:
+        stats.bytesIn = os.path.getsize(inputFilepath)
+        stats.bytesOut = sum(fileStats.bytesOut for fileStats in stats.files)
+        stats.symbols = sum(fileStats.symbols for fileStats in stats.files)
+        stats.Finish()
+    return "".join(allContents)
+
+def CheckEntry(reader, entry):
+    #Returns what is wrong with the directory record of an archive entry,
+    #without looking at its payload
+    problems = []
+    tables = reader.Tables()
+    if entry.method not in METHOD_NAMES:
+        problems.append(f"unknown method {entry.method}")
+    elif entry.method == METHOD_ORDER1:
+        if entry.tableIndex + 1 >= len(tables) or not isinstance(tables[entry.tableIndex + 1], tuple):
+            problems.append(f"table {entry.tableIndex} is not an order-1 model")
+    elif entry.method == METHOD_HUFFMAN and entry.tableIndex >= len(tables):
+        problems.append(f"table {entry.tableIndex} does not exist")
+    return problems
+
+def VerifyEntry(reader, entry, decode=True):
+    #Checks one entry of an open archive: its directory record, the checksum of
+    #every block (or of the payload of an entry without blocks), and (if decode) that every block decodes to the
+    #number of symbols the directory says it holds
+    #Returns a list of what is wrong with it, empty if nothing is
+    problems = [] if IsSafeName(entry.name) else ["name is not a plain file name"]
+    structure = CheckEntry(reader, entry)
+    if structure:
+        return problems + structure
+    try:
+        for index, (data, bitLength, symbolCount) in enumerate(reader.Blocks(entry)):
+            if decode:
+                decoded = sum(map(len, IterBlockChunks(reader, entry.method, entry.tableIndex, data, bitLength)))
+                if decoded != symbolCount:
+                    problems.append(f"block {index} decodes to {decoded} symbols instead of {symbolCount}")
+    except Exception as e:
+        problems.append(str(e))
+    return problems
+
+def Verify(inputFilepath, workers=1, decode=True, dictionaries=()):
+    #Checks a .bin file without writing anything and returns (ArchiveEntry, problems)
+    #for every file in it, where problems is a list of strings that is empty for a good file
+    #The header and directory checksums are checked on the way in and raise ValueError
+    #if they do not match, since nothing after them can be trusted
+    #Then every entry is checked by VerifyEntry, with decode=False only the
+    #structure and checksums are checked, which is much faster than decoding
+    #With workers > 1 (or None for every CPU) the entries are checked in a process pool
+    #Older pickled files have no checksums, they can only be decoded to see if they fail
+    workers = ResolveWorkers(workers)
+    dictionaries = [dictionary.path for dictionary in map(LoadDictionary, dictionaries)]
+    with ArchiveReader(inputFilepath) as reader:
+        if reader.IsArchive():
+            reader.Tables()
+            entries = reader.Entries()
+            if workers > 1 and len(entries) > 1:
+                with ProcessPoolExecutor(workers, initializer=InitDecodeWorker, initargs=(inputFilepath, dictionaries)) as executor:
+                    checked = list(BoundedMap(executor, VerifyEntryWorker, ((entry, decode) for entry in entries), 2 * workers))
+            else:
+                checked = [VerifyEntry(reader, entry, decode) for entry in entries]
+            return list(zip(entries, checked))
+
+    results = []
+    try:
+        for filename, chunks in IterArchiveFiles(inputFilepath):
+            entry = ArchiveEntry(filename)
+            results.append((entry, [] if IsSafeName(filename) else ["name is not a plain file name"]))
+            if decode:
+                entry.symbolCount = sum(map(len, chunks))
+    except Exception as e:
+        if not results:
+            raise ValueError(f"{inputFilepath} is not an archive or is corrupt: {e}") from None
+        results[-1][1].append(str(e))
+    return results
+
+def CheckName(filename):
+    #Returns filename if it is safe to write inside an output directory (see IsSafeName)
+    if not IsSafeName(filename):
+        raise ValueError(f"'{filename}' is not a plain file name, refusing to write it")
+    return filename
+
+def OutputPath(outputDir, filename):
+    #Where Decompress writes a file from an archive
+    return os.path.join(outputDir, f"decompressed_{CheckName(filename)}")
+
+def RecordOutput(stats, outputPath, entry):
+    #Adds the numbers of a file that was just decompressed to stats
+    #Older pickled files have no directory, so only their output size is known
+    if stats.enabled:
+        stats.AddFile(entry.name, METHOD_NAMES[entry.method], entry.byteLength, os.path.getsize(outputPath), entry.symbolCount)
 
-        bitString = encodedBits.to01()
-        decodedText = ""
-        currentCode = ""
-        for bit in bitString:
-            currentCode += bit
-            if currentCode in reverseCodeTable:
-                decodedText += reverseCodeTable[currentCode]
-                currentCode = ""
-
-        outputPath = os.path.join(outputDir, f"decompressed_{filename}")
-        with open(outputPath, "w", encoding="utf-8") as outfile:
-            outfile.write(decodedText)
-            allContents += (outputPath + "\n" + decodedText + "\n\n")
-
-    return allContents
+def SymbolName(symbol):
+    #Returns a printable name for a symbol in a code table
+    #Byte values are shown in hex, characters are shown as they are
+    if isinstance(symbol, int):
+        return f"0x{symbol:02X}"
+    return symbol
 
 def GetFileSize(filepath):
     #This takes a file path and returns the
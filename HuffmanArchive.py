@@ -0,0 +1,466 @@
+import mmap
+import os
+import struct
+import zlib
+from bitarray import bitarray
+
+#Binary container used by Compress
+#The layout of a file is
+    #Header    -> magic, version, flags and the number of code tables
+    #Tables    -> canonical Huffman code lengths (symbol and length only)
+    #Checksum  -> CRC32 of the header and tables
+    #Payloads  -> the packed bits of every entry, each starting on a byte boundary
+    #Directory -> one record per entry with its name, method, table, original size and the
+    #             bit length, symbol count and CRC32 of each of its blocks (or of its whole payload)
+    #Footer    -> where the directory starts, its length, the number of entries and its CRC32
+#Directory numbers are varints (7 bits a byte, low bits first, the top bit set on every
+#byte but the last) and nothing that can be worked out is stored: payloads follow each
+#other so offsets add up from the first, which ends where the directory starts, and every
+#payload (or block) is its bits padded to a whole byte, so a small file costs a dozen or so
+#bytes plus its name
+#The directory goes at the end so the archive can be written in one pass
+#(even to a pipe), readers seek to the footer to find it
+#An entry written in blocks has every block start on a byte boundary and each
+#block can be decoded on its own, entries without blocks are one continuous run of bits
+#The header and directory checksums are checked whenever they are read, and every
+#block is checked just before it is decoded, so a damaged archive fails at the
+#damaged block instead of decoding garbage
+
+MAGIC = b"HUFA"
+VERSION = 1
+
+#Table kinds
+TABLE_TEXT = 0              #Symbols are characters, stored as UTF-8
+TABLE_BYTES = 1             #Symbols are byte values 0 to 255, stored as single bytes
+TABLE_TEXT_CONTEXTS = 2     #The contexts of an order-1 model (characters), no code lengths
+TABLE_BYTES_CONTEXTS = 3    #The contexts of an order-1 model (byte values), no code lengths
+TABLE_DICTIONARY = 4        #The ID of a dictionary file holding the code lengths (see HuffmanDictionary.py)
+
+#Entry methods
+METHOD_HUFFMAN = 0  #Payload is encoded with the entry's code table
+METHOD_STORED = 1   #Payload is the file as it is (UTF-8 in text archives), no table is used
+METHOD_ORDER1 = 2   #Payload is encoded with the order-1 model starting at the entry's table
+                    #The model's tables are the fallback code table, a contexts table with the
+                    #symbols that have their own code table, then one code table per context
+METHOD_NAMES = {METHOD_HUFFMAN: "huffman", METHOD_STORED: "stored", METHOD_ORDER1: "order1"}
+
+#Header flags
+FLAG_BYTES = 1      #Entries were read as raw bytes, so stored entries are not UTF-8 text
+
+HEADER = struct.Struct(">4sBBH")        #magic, version, flags, table count
+TABLE_HEADER = struct.Struct(">BBI")    #kind, max code length, symbol byte length
+FOOTER = struct.Struct(">QQII4s")       #directory offset, directory length, entry count, directory CRC32, magic
+CHECKSUM = struct.Struct(">I")          #CRC32 of the header and tables, a payload or a block
+
+class ArchiveEntry:
+    #This class describes one file stored in an archive
+    #Each entry has
+        #name -> the original filename
+        #method -> how the payload is stored
+        #tableIndex -> which code table the payload uses
+        #offset -> where the payload starts in the archive
+        #byteLength -> the size of the payload in bytes
+        #bitLength -> the number of bits in the payload
+        #symbolCount -> the number of characters (or bytes) in the original file
+        #originalSize -> the size in bytes of the original file
+        #blocks -> (bit length, symbol count) of each block, empty if the entry is not split up
+        #crc -> CRC32 of the payload of an entry without blocks (None for older pickled files)
+        #blockCrcs -> CRC32 of each block
+    def __init__(self, name, method=METHOD_HUFFMAN, tableIndex=0, offset=0, byteLength=0, bitLength=0, symbolCount=0, originalSize=0, blocks=None, crc=None, blockCrcs=None):
+        self.name = name
+        self.method = method
+        self.tableIndex = tableIndex
+        self.offset = offset
+        self.byteLength = byteLength
+        self.bitLength = bitLength
+        self.symbolCount = symbolCount
+        self.originalSize = originalSize
+        self.blocks = blocks if blocks is not None else []
+        self.crc = crc
+        self.blockCrcs = blockCrcs if blockCrcs is not None else []
+
+    def HasChecksums(self):
+        return bool(self.blockCrcs) if self.blocks else self.crc is not None
+
+    def BlockCrc(self, index):
+        #Returns the CRC32 of block index (see IterBlocks)
+        if not self.blocks:
+            return self.crc
+        return self.blockCrcs[index]
+
+    def IterBlocks(self):
+        #Yields (offset, byte length, bit length, symbol count) for every block
+        #An entry without blocks is treated as one block covering the whole payload
+        if not self.blocks:
+            yield self.offset, self.byteLength, self.bitLength, self.symbolCount
+            return
+        offset = self.offset
+        for bitLength, symbolCount in self.blocks:
+            byteLength = (bitLength + 7) // 8
+            yield offset, byteLength, bitLength, symbolCount
+            offset += byteLength
+
+class DictionaryRef:
+    #This class stands in for a code table that is kept in a dictionary file
+    #Each reference has
+        #id -> the ID of the dictionary (bytes)
+    def __init__(self, dictionaryId):
+        self.id = dictionaryId
+
+def CheckBlock(data, crc, name, index):
+    #Raises if block index of the entry called name does not match its checksum
+    if zlib.crc32(data) != crc:
+        raise ValueError(f"'{name}' is corrupt: block {index} does not match its checksum")
+
+def IsSafeName(name):
+    #True for a plain file name, which cannot point outside the directory it is written to
+    #Names come from the directory of whatever archive is being read, so absolute
+    #paths, drive letters, separators and "." or ".." are not trusted
+    return (bool(name) and name not in (".", "..") and not any(c in name for c in "/\\\0")
+            and not os.path.isabs(name) and not os.path.splitdrive(name)[0])
+
+def PackVarint(value):
+    #Turns a number of 0 or more into a varint
+    data = bytearray()
+    while value > 0x7F:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+    return bytes(data)
+
+def ReadVarint(data, position):
+    #Reads the varint at position of data and returns (value, position after it)
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def ReadExact(infile, size):
+    #Reads exactly size bytes or raises if the file is too short
+    data = infile.read(size)
+    if len(data) != size:
+        raise ValueError("Archive is truncated")
+    return data
+
+def PackTable(codeLengths):
+    #Turns a {symbol: code length} dictionary into bytes
+    #Symbols are sorted into canonical order (by length then symbol)
+    #so we only need to store how many codes there are of each length
+    #Character symbols make a TABLE_TEXT table and byte values a TABLE_BYTES table
+    #A tuple of context symbols makes a contexts table and a DictionaryRef a dictionary table
+    if isinstance(codeLengths, tuple):
+        return PackContexts(codeLengths)
+    if isinstance(codeLengths, DictionaryRef):
+        return TABLE_HEADER.pack(TABLE_DICTIONARY, 0, len(codeLengths.id)) + codeLengths.id
+    symbols = sorted(codeLengths, key=lambda symbol: (codeLengths[symbol], symbol))
+    maxLength = max(codeLengths.values(), default=0)
+    counts = [0] * maxLength
+    for symbol in symbols:
+        counts[codeLengths[symbol] - 1] += 1
+    if symbols and isinstance(symbols[0], int):
+        kind = TABLE_BYTES
+        symbolBytes = bytes(symbols)
+    else:
+        kind = TABLE_TEXT
+        symbolBytes = "".join(symbols).encode("utf-8")
+    return (TABLE_HEADER.pack(kind, maxLength, len(symbolBytes))
+            + struct.pack(f">{maxLength}I", *counts)
+            + symbolBytes)
+
+def PackContexts(contexts):
+    #Turns the tuple of context symbols of an order-1 model into bytes
+    if contexts and isinstance(contexts[0], int):
+        kind = TABLE_BYTES_CONTEXTS
+        symbolBytes = bytes(contexts)
+    else:
+        kind = TABLE_TEXT_CONTEXTS
+        symbolBytes = "".join(contexts).encode("utf-8")
+    return TABLE_HEADER.pack(kind, 0, len(symbolBytes)) + symbolBytes
+
+def ReadTable(infile):
+    #Reads a table written by PackTable and returns {symbol: code length}
+    #with the symbols in canonical order (or a tuple of symbols for a contexts table
+    #and a DictionaryRef for a dictionary table)
+    kind, maxLength, symbolByteLength = TABLE_HEADER.unpack(ReadExact(infile, TABLE_HEADER.size))
+    if kind == TABLE_DICTIONARY:
+        return DictionaryRef(ReadExact(infile, symbolByteLength))
+    if kind == TABLE_TEXT_CONTEXTS:
+        return tuple(ReadExact(infile, symbolByteLength).decode("utf-8"))
+    if kind == TABLE_BYTES_CONTEXTS:
+        return tuple(ReadExact(infile, symbolByteLength))
+    if kind not in (TABLE_TEXT, TABLE_BYTES):
+        raise ValueError(f"Unknown code table kind {kind}")
+    counts = struct.unpack(f">{maxLength}I", ReadExact(infile, 4 * maxLength))
+    symbols = ReadExact(infile, symbolByteLength)
+    if kind == TABLE_TEXT:
+        symbols = symbols.decode("utf-8")
+    if len(symbols) != sum(counts):
+        raise ValueError("Code table is corrupt")
+
+    codeLengths = {}
+    position = 0
+    for length, count in enumerate(counts, start=1):
+        for symbol in symbols[position:position + count]:
+            codeLengths[symbol] = length
+        position += count
+    return codeLengths
+
+class ArchiveWriter:
+    #This class writes an archive to an open binary file one entry at a time
+    #Usage:
+        #writer = ArchiveWriter(outfile, [codeLengths])
+        #writer.BeginEntry(name, tableIndex, method)
+        #writer.WriteBits(bits) or writer.WriteBlock(...) as many times as needed
+        #(or writer.WriteStored(data) for an entry begun with METHOD_STORED)
+        #writer.EndEntry(symbolCount, originalSize)
+        #or writer.WriteEntry(...) for a payload that is already packed
+        #writer.Close() once every entry has been written
+    def __init__(self, outfile, tables, flags=0):
+        self.outfile = outfile
+        self.entries = []
+        self.current = None
+        self.pending = None  #Bits that do not fill a whole byte yet
+        self.position = 0    #Bytes written so far, tracked so pipes work too
+
+        header = HEADER.pack(MAGIC, VERSION, flags, len(tables)) + b"".join(map(PackTable, tables))
+        self.Write(header)
+        self.Write(CHECKSUM.pack(zlib.crc32(header)))
+
+    def Write(self, data):
+        #Writes data to the archive, adding it to the checksum of the current entry
+        self.outfile.write(data)
+        self.position += len(data)
+        if self.current is not None:
+            self.current.crc = zlib.crc32(data, self.current.crc)
+
+    def BeginEntry(self, name, tableIndex=0, method=METHOD_HUFFMAN):
+        self.current = ArchiveEntry(name, method, tableIndex, self.position, crc=0)
+        self.pending = bitarray()
+
+    def WriteBits(self, bits):
+        #Writes every whole byte and keeps the leftover bits for next time
+        self.pending += bits
+        self.current.bitLength += len(bits)
+        wholeBits = len(self.pending) & ~7
+        if wholeBits:
+            self.Write(self.pending[:wholeBits].tobytes())
+            del self.pending[:wholeBits]
+
+    def WriteStored(self, data):
+        #Writes bytes of a stored entry as they are
+        self.Write(data)
+        self.current.bitLength += 8 * len(data)
+
+    def EndEntry(self, symbolCount, originalSize):
+        #Pads the last byte with zeros and records the entry
+        self.Write(self.pending.tobytes())
+        entry = self.current
+        entry.byteLength = self.position - entry.offset
+        entry.symbolCount = symbolCount
+        entry.originalSize = originalSize
+        self.entries.append(entry)
+        self.current = None
+        self.pending = None
+
+    def WriteBlock(self, data, bitLength, symbolCount):
+        #Writes one independently decodable block of the current entry
+        #data holds the packed bits, padded to a whole number of bytes
+        self.Write(data)
+        self.current.bitLength += bitLength
+        self.current.blocks.append((bitLength, symbolCount))
+        self.current.blockCrcs.append(zlib.crc32(data))
+
+    def WriteEntry(self, name, data, bitLength, symbolCount, originalSize, tableIndex=0, method=METHOD_HUFFMAN):
+        #Writes an entry whose payload has already been packed into bytes
+        entry = ArchiveEntry(name, method, tableIndex, self.position, len(data), bitLength, symbolCount, originalSize, crc=zlib.crc32(data))
+        self.Write(data)
+        self.entries.append(entry)
+
+    def Close(self):
+        #Writes the directory and the footer
+        directoryOffset = self.position
+        directory = b"".join(map(PackEntry, self.entries))
+        self.Write(directory)
+        self.Write(FOOTER.pack(directoryOffset, len(directory), len(self.entries), zlib.crc32(directory), MAGIC))
+
+def PackEntry(entry):
+    #Turns an entry into its directory record
+    #An entry without blocks is written as one block holding its whole payload
+    name = entry.name.encode("utf-8")
+    record = [PackVarint(len(name)), name, bytes((entry.method,)), PackVarint(entry.tableIndex),
+              PackVarint(entry.originalSize), PackVarint(len(entry.blocks))]
+    if entry.blocks:
+        blocks = zip(entry.blocks, entry.blockCrcs)
+    else:
+        blocks = [((entry.bitLength, entry.symbolCount), entry.crc)]
+    for (bitLength, symbolCount), crc in blocks:
+        record += [PackVarint(bitLength), PackVarint(symbolCount), CHECKSUM.pack(crc)]
+    return b"".join(record)
+
+def UnpackEntries(directory, entryCount, directoryOffset):
+    #Reads the records written by PackEntry and fills in what they leave out
+    entries = []
+    position = 0
+    for _ in range(entryCount):
+        nameLength, position = ReadVarint(directory, position)
+        name = directory[position:position + nameLength].decode("utf-8")
+        position += nameLength
+        method = directory[position]
+        tableIndex, position = ReadVarint(directory, position + 1)
+        originalSize, position = ReadVarint(directory, position)
+        blockCount, position = ReadVarint(directory, position)
+        blocks = []
+        crcs = []
+        for _ in range(max(blockCount, 1)):
+            bitLength, position = ReadVarint(directory, position)
+            symbolCount, position = ReadVarint(directory, position)
+            crc, = CHECKSUM.unpack_from(directory, position)
+            position += CHECKSUM.size
+            blocks.append((bitLength, symbolCount))
+            crcs.append(crc)
+        entry = ArchiveEntry(name, method, tableIndex, originalSize=originalSize)
+        entry.bitLength = sum(bitLength for bitLength, symbolCount in blocks)
+        entry.symbolCount = sum(symbolCount for bitLength, symbolCount in blocks)
+        entry.byteLength = sum((bitLength + 7) // 8 for bitLength, symbolCount in blocks)
+        if blockCount:
+            entry.blocks = blocks
+            entry.blockCrcs = crcs
+        else:
+            entry.crc = crcs[0]
+        entries.append(entry)
+    if position != len(directory):
+        raise ValueError("Archive directory is corrupt")
+
+    offset = directoryOffset - sum(entry.byteLength for entry in entries)
+    if offset < HEADER.size + CHECKSUM.size:
+        raise ValueError("Archive directory is corrupt: its payloads do not fit in the archive")
+    for entry in entries:
+        entry.offset = offset
+        offset += entry.byteLength
+    return entries
+
+def ReadVersion(infile):
+    #Reads the fixed part of the header and returns (flags, table count)
+    infile.seek(0)
+    magic, version, flags, tableCount = HEADER.unpack(ReadExact(infile, HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a Huffman archive")
+    if version != VERSION:
+        raise ValueError(f"Unsupported archive version {version}")
+    return flags, tableCount
+
+def ReadHeader(infile):
+    #Reads the header and code tables from the start of an archive
+    #Returns (flags, list of {symbol: code length})
+    flags, tableCount = ReadVersion(infile)
+    try:
+        tables = [ReadTable(infile) for _ in range(tableCount)]
+    except (ValueError, struct.error, UnicodeDecodeError):
+        raise ValueError("Archive header is corrupt") from None
+    headerLength = infile.tell()
+    checksum, = CHECKSUM.unpack(ReadExact(infile, CHECKSUM.size))
+    infile.seek(0)
+    if zlib.crc32(ReadExact(infile, headerLength)) != checksum:
+        raise ValueError("Archive header is corrupt: it does not match its checksum")
+    return flags, tables
+
+def ReadDirectory(infile):
+    #Reads the footer and the directory at the end of an archive
+    #and returns the list of ArchiveEntry objects
+    #Raises if the directory is damaged or points outside the payloads
+    ReadVersion(infile)
+    infile.seek(0, 2)
+    archiveLength = infile.tell()
+    if archiveLength < HEADER.size + FOOTER.size:
+        raise ValueError("Archive is truncated or corrupt")
+    infile.seek(-FOOTER.size, 2)
+    directoryOffset, directoryLength, entryCount, directoryCrc, magic = FOOTER.unpack(ReadExact(infile, FOOTER.size))
+    if magic != MAGIC or directoryOffset + directoryLength + FOOTER.size != archiveLength:
+        raise ValueError("Archive is truncated or corrupt")
+    infile.seek(directoryOffset)
+    directory = ReadExact(infile, directoryLength)
+    if zlib.crc32(directory) != directoryCrc:
+        raise ValueError("Archive directory is corrupt: it does not match its checksum")
+    try:
+        return UnpackEntries(directory, entryCount, directoryOffset)
+    except (struct.error, UnicodeDecodeError, IndexError):
+        raise ValueError("Archive directory is corrupt") from None
+
+class ArchiveReader:
+    #This class reads an archive through a memory map
+    #Opening one only maps the file, the header, tables and directory are parsed
+    #the first time they are asked for and payloads are handed out as memoryview
+    #slices of the map, so nothing is copied until a decoder reads it
+    #Usage:
+        #with ArchiveReader(path) as reader:
+            #for entry in reader.Entries():
+                #data = reader.Payload(entry)
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError("Not a Huffman archive")
+        self.view = memoryview(self.map)
+        self.header = None   #(flags, tables) once parsed
+        self.entries = None
+        self.cache = {}      #Somewhere for callers to keep things built from the tables
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.Close()
+
+    def IsArchive(self):
+        #False for older pickled files
+        return self.view[:len(MAGIC)] == MAGIC
+
+    def Flags(self):
+        return self.ReadHeader()[0]
+
+    def Tables(self):
+        #Returns the list of {symbol: code length} tables
+        return self.ReadHeader()[1]
+
+    def ReadHeader(self):
+        if self.header is None:
+            self.header = ReadHeader(self.map)
+        return self.header
+
+    def Entries(self):
+        #Returns the list of ArchiveEntry objects from the directory
+        if self.entries is None:
+            self.entries = ReadDirectory(self.map)
+        return self.entries
+
+    def FindEntry(self, name):
+        #Returns the entry called name or None
+        return next((entry for entry in self.Entries() if entry.name == name), None)
+
+    def Payload(self, entry):
+        #Returns the whole payload of an entry as a memoryview
+        return self.view[entry.offset:entry.offset + entry.byteLength]
+
+    def Blocks(self, entry):
+        #Yields (memoryview, bit length, symbol count) for every block of an entry
+        #Each block is checked against its checksum before it is handed out
+        for index, (offset, byteLength, bitLength, symbolCount) in enumerate(entry.IterBlocks()):
+            data = self.view[offset:offset + byteLength]
+            CheckBlock(data, entry.BlockCrc(index), entry.name, index)
+            yield data, bitLength, symbolCount
+
+    def Close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass #A payload view is still in use, the map closes once it is released
+        self.file.close()
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from Huffman import Compress, Decompress, IterDecompress, CHUNK_SIZE
+from HuffmanStats import ControlledStats
+from AdaptiveHuffman import AdaptiveCompressor, AdaptiveDecompressor
+
+#asyncio front end for services that compress and decompress on an event loop
+#Compress and Decompress block for the whole job, here they run in an executor
+#so the loop keeps serving other requests while they work
+#Usage:
+    #stats = await CompressAsync(paths, "out.bin", progress=callback)
+    #await DecompressAsync("out.bin", "outdir")
+    #async for filename, chunk in IterDecompressAsync("out.bin"): ...
+    #await CompressStreamAsync(reader, writer) for asyncio streams (one pass format)
+#A HuffmanService runs at most maxJobs jobs at once, further jobs wait their turn
+#the functions above use a default service for the running loop
+#Jobs run in threads: the file reads and writes happen there too, so the loop never
+#waits on the disk, and workers= still hands the encoding to a process pool
+#Cancelling the awaiting task stops the job at its next chunk or file, the partial
+#output archive is removed, and the task only finishes once the thread has let go of its files
+#progress is called on the loop as progress(event, values, stats) with the events of
+#HuffmanStats.py, including "chunk" for every chunk
+
+MAX_JOBS = os.cpu_count() or 1  #Jobs a service runs at once unless told otherwise
+QUEUE_CHUNKS = 8                #Decoded chunks IterDecompressAsync reads ahead of its caller
+
+def AsyncStats(loop, progress=None):
+    #Returns the ControlledStats of a job, with progress called on loop rather than the job's thread
+    if progress is None:
+        return ControlledStats()
+    return ControlledStats(lambda event, values, stats: loop.call_soon_threadsafe(progress, event, values, stats))
+
+class HuffmanService:
+    #This class runs compression jobs for one event loop
+    #Each service has
+        #maxJobs -> how many jobs run at once
+        #executor -> where the jobs run, a thread pool of maxJobs threads unless one is given
+        #semaphore -> held by every running job
+    def __init__(self, maxJobs=MAX_JOBS, executor=None):
+        if maxJobs < 1:
+            raise ValueError("maxJobs must be at least 1")
+        self.maxJobs = maxJobs
+        self.ownsExecutor = executor is None
+        self.executor = executor if executor is not None else ThreadPoolExecutor(maxJobs, thread_name_prefix="huffman")
+        self.semaphore = asyncio.Semaphore(maxJobs)
+
+    async def Run(self, func, stats=None, cleanup=None):
+        #Runs func() in the executor once a job slot is free and returns its result
+        #If the task is cancelled the job is told to stop, waited for, and cleanup() is called
+        loop = asyncio.get_running_loop()
+        async with self.semaphore:
+            future = loop.run_in_executor(self.executor, func)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if stats is not None:
+                    stats.Cancel()
+                await asyncio.wait([future])
+                if not future.cancelled():
+                    future.exception() #Most likely JobCancelled, which is expected
+                if cleanup is not None:
+                    cleanup()
+                raise
+
+    async def Compress(self, inputFilepaths, outputFilepath="compressed.bin", progress=None, **options):
+        #Compress in the background, takes the same options and returns its JobStats
+        loop = asyncio.get_running_loop()
+        stats = AsyncStats(loop, progress)
+        job = partial(Compress, list(inputFilepaths), outputFilepath, stats=stats, **options)
+        return await self.Run(job, stats, partial(RemovePartial, outputFilepath))
+
+    async def Decompress(self, inputFilepath="compressed.bin", outputDir="decompressed_files", progress=None, **options):
+        #Decompress in the background, takes the same options
+        #Returns (the text Decompress returns, its JobStats)
+        loop = asyncio.get_running_loop()
+        stats = AsyncStats(loop, progress)
+        job = partial(Decompress, inputFilepath, outputDir, stats=stats, **options)
+        return await self.Run(job, stats), stats
+
+    async def IterDecompress(self, inputFilepath="compressed.bin", readAhead=QUEUE_CHUNKS):
+        #Yields (filename, chunk) like IterDecompress while the decoding runs in the executor
+        #At most readAhead chunks are decoded ahead of the caller, so a slow caller holds
+        #back the decoder rather than filling memory
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(readAhead)
+        stop = threading.Event()
+        done = object()
+
+        def Produce():
+            #Runs in the executor, every put waits for room in the queue
+            try:
+                for item in IterDecompress(inputFilepath):
+                    if stop.is_set():
+                        return
+                    asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+            except BaseException as e:
+                asyncio.run_coroutine_threadsafe(queue.put(e), loop).result()
+                return
+            asyncio.run_coroutine_threadsafe(queue.put(done), loop).result()
+
+        async with self.semaphore:
+            producer = loop.run_in_executor(self.executor, Produce)
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is done:
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    yield item
+            finally:
+                #The caller stopped early (or was cancelled), unblock the producer and let it finish
+                stop.set()
+                while not producer.done():
+                    while not queue.empty():
+                        queue.get_nowait()
+                    await asyncio.wait([producer], timeout=0.01)
+
+    async def CompressStream(self, reader, writer, chunkSize=CHUNK_SIZE):
+        #Compresses everything read from reader to writer in the one pass stream format
+        #reader needs an async read(size) (like asyncio.StreamReader) and writer a write(data)
+        #with an optional async drain() (like asyncio.StreamWriter)
+        #Returns (bytes read, bytes written)
+        return await self.Stream(AdaptiveCompressor(), reader, writer, chunkSize)
+
+    async def DecompressStream(self, reader, writer, chunkSize=CHUNK_SIZE):
+        #Decompresses a stream made by CompressStream, anything read after its end is ignored
+        #Returns (bytes read, bytes written)
+        return await self.Stream(AdaptiveDecompressor(), reader, writer, chunkSize)
+
+    async def Stream(self, coder, reader, writer, chunkSize):
+        #Feeds chunks from reader through coder in the executor, writing what comes out
+        loop = asyncio.get_running_loop()
+        bytesIn = bytesOut = 0
+        async with self.semaphore:
+            while not getattr(coder, "eof", False):
+                data = await reader.read(chunkSize)
+                if not data:
+                    break
+                bytesIn += len(data)
+                output = await loop.run_in_executor(self.executor, coder.Feed, data)
+                bytesOut += await WriteAsync(writer, output)
+            output = await loop.run_in_executor(self.executor, coder.Flush)
+            bytesOut += await WriteAsync(writer, output)
+        return bytesIn, bytesOut
+
+    def Close(self):
+        #Shuts down the executor if the service made it
+        if self.ownsExecutor:
+            self.executor.shutdown(wait=False)
+
+def RemovePartial(outputFilepath):
+    #Removes the archive a cancelled Compress was writing (file objects are left alone)
+    if isinstance(outputFilepath, (str, bytes, os.PathLike)) and os.path.exists(outputFilepath):
+        os.remove(outputFilepath)
+
+async def WriteAsync(writer, data):
+    #Writes data to writer, waiting for it to drain if it can
+    if data:
+        writer.write(data)
+        drain = getattr(writer, "drain", None)
+        if drain is not None:
+            await drain()
+    return len(data)
+
+#The default service of every event loop, made the first time a loop needs one
+defaultServices = weakref.WeakKeyDictionary()
+
+def DefaultService():
+    loop = asyncio.get_running_loop()
+    if loop not in defaultServices:
+        defaultServices[loop] = HuffmanService()
+    return defaultServices[loop]
+
+async def CompressAsync(inputFilepaths, outputFilepath="compressed.bin", progress=None, service=None, **options):
+    return await (service or DefaultService()).Compress(inputFilepaths, outputFilepath, progress, **options)
+
+async def DecompressAsync(inputFilepath="compressed.bin", outputDir="decompressed_files", progress=None, service=None, **options):
+    return await (service or DefaultService()).Decompress(inputFilepath, outputDir, progress, **options)
+
+def IterDecompressAsync(inputFilepath="compressed.bin", readAhead=QUEUE_CHUNKS, service=None):
+    return (service or DefaultService()).IterDecompress(inputFilepath, readAhead)
+
+async def CompressStreamAsync(reader, writer, chunkSize=CHUNK_SIZE, service=None):
+    return await (service or DefaultService()).CompressStream(reader, writer, chunkSize)
+
+async def DecompressStreamAsync(reader, writer, chunkSize=CHUNK_SIZE, service=None):
+    return await (service or DefaultService()).DecompressStream(reader, writer, chunkSize)
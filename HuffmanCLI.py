@@ -0,0 +1,354 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from Huffman import (Compress, Decompress, Extract, IterDecompress, IterEntryChunks, List, OpenOutput, OutputPath, RequireEntry, Verify,
+                     BACKENDS, MODES, TABLE_MODES, ORDERS, CHUNK_SIZE)
+from HuffmanArchive import ArchiveReader, MAGIC, METHOD_NAMES
+from HuffmanDictionary import LoadDictionary
+from HuffmanStats import JobStats
+from AdaptiveHuffman import CompressStream, DecompressStream, STREAM_MAGIC
+
+#Command line interface for the compression tool
+#Run with: python HuffmanCLI.py <command> ... (or python Main.py <command> ...)
+#Commands
+    #compress <paths...> [-o archive]   -> paths can be files, directories or globs, "-" reads stdin
+    #decompress <archive> [-o dir]      -> "-" reads stdin, -c writes the contents to stdout
+    #list <archive>
+    #extract <archive> <member> [dest]
+    #verify <archive> [--quick]        -> checks the checksums (and decodes unless --quick), writes nothing
+    #bench
+    #gui
+#Reading from stdin uses the one pass adaptive stream format (see AdaptiveHuffman.py)
+#since stdin can only be read once, decompress tells the two formats apart by their magic
+#Nothing here imports tkinter unless the gui command is used
+
+STDIO = "-"
+
+def ExpandInputs(patterns):
+    #Turns the paths given on the command line into a sorted list of files
+    #Directories are walked and globs are expanded (for shells that do not do it)
+    filepaths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            raise FileNotFoundError(f"No files match {pattern}")
+        for path in sorted(matches):
+            if os.path.isdir(path):
+                for directory, subdirectories, filenames in os.walk(path):
+                    subdirectories.sort()
+                    filepaths.extend(os.path.join(directory, filename) for filename in sorted(filenames))
+            elif os.path.isfile(path):
+                filepaths.append(path)
+            else:
+                raise FileNotFoundError(f"{path} does not exist")
+
+    #Archives store the file name only, so two files with the same name would clash
+    seen = {}
+    for filepath in filepaths:
+        name = os.path.basename(filepath)
+        if name in seen and seen[name] != filepath:
+            raise ValueError(f"{seen[name]} and {filepath} have the same name")
+        seen[name] = filepath
+    return list(dict.fromkeys(filepaths))
+
+def Ratio(packedSize, originalSize):
+    #Compressed size as a percentage of the original
+    return packedSize / originalSize * 100 if originalSize else 0.0
+
+def Throughput(size, seconds):
+    #MB/s, guarding against timers too coarse to see a tiny file
+    return size / (1 << 20) / max(seconds, 1e-9)
+
+def ReportFile(toStdout):
+    #Reports go to stderr when the data itself is going to stdout
+    return sys.stderr if toStdout else sys.stdout
+
+def IsStream(path):
+    #True for a file in the adaptive stream format
+    with open(path, "rb") as infile:
+        return infile.read(len(STREAM_MAGIC)) == STREAM_MAGIC
+
+def SpoolStdin():
+    #Archives have to be read in any order, so stdin is copied to a temporary file first
+    #Returns the path, the caller removes it
+    spool = tempfile.NamedTemporaryFile(delete=False)
+    with spool:
+        shutil.copyfileobj(sys.stdin.buffer, spool, CHUNK_SIZE)
+    return spool.name
+
+class CountingWriter:
+    #This class wraps a binary file object and counts the bytes written through it
+    def __init__(self, outfile):
+        self.outfile = outfile
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self.outfile.write(data)
+
+    def flush(self):
+        self.outfile.flush()
+
+class CountingReader:
+    #This class wraps a binary file object and counts the bytes read through it
+    def __init__(self, infile):
+        self.infile = infile
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.infile.read(size)
+        self.count += len(data)
+        return data
+
+    def read1(self, size=-1):
+        #Passed through so streams are coded as the data arrives (see ReadSome)
+        data = getattr(self.infile, "read1", self.infile.read)(size)
+        self.count += len(data)
+        return data
+
+def WriteStdout(out, chunks):
+    #Writes decoded chunks to a binary stream, text as UTF-8
+    for chunk in chunks:
+        out.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+    out.flush()
+
+def CommandCompress(args):
+    toStdout = args.output == STDIO
+    report = ReportFile(toStdout)
+    output = sys.stdout.buffer if toStdout else args.output
+
+    if args.paths == [STDIO]:
+        #stdin can only be read once so use the one pass stream format
+        start = time.perf_counter()
+        with OpenOutput(output) as outfile:
+            counter = CountingWriter(outfile)
+            reader = CountingReader(sys.stdin.buffer)
+            CompressStream(reader, counter)
+            counter.flush()
+        seconds = time.perf_counter() - start
+        print(f"stdin: {reader.count} -> {counter.count} bytes ({Ratio(counter.count, reader.count):.1f}%) "
+              f"{Throughput(reader.count, seconds):.2f} MB/s", file=report)
+        return 0
+
+    filepaths = ExpandInputs(args.paths)
+    stats = Compress(filepaths, output, chunkSize=args.chunk_size, workers=args.workers,
+                     blockSize=args.block_size, backend=args.backend, mode=args.mode, tables=args.tables,
+                     allowStored=not args.no_store, order=args.order, dictionary=args.dictionary, stats=JobStats())
+    if stats is None:
+        return 1 #Compress has already said there was no data
+
+    for fileStats in stats.files:
+        print(f"{fileStats.name}: {fileStats.bytesIn} -> {fileStats.bytesOut} bytes "
+              f"({Ratio(fileStats.bytesOut, fileStats.bytesIn):.1f}%, {fileStats.method}) "
+              f"{Throughput(fileStats.bytesIn, fileStats.seconds):.2f} MB/s", file=report)
+    print(f"total: {len(filepaths)} files, {stats.bytesIn} -> {stats.bytesOut} bytes ({Ratio(stats.bytesOut, stats.bytesIn):.1f}%) "
+          f"in {stats.seconds:.2f}s, {Throughput(stats.bytesIn, stats.seconds):.2f} MB/s", file=report)
+    if args.stats:
+        print("  ".join(f"{phase} {seconds:.3f}s" for phase, seconds in stats.phases.items()), file=report)
+        with open(args.stats, "w", encoding="utf-8") as outfile:
+            json.dump(stats.AsDict(), outfile, indent=2)
+    return 0
+
+def DecompressStreamTo(infile, args, report):
+    #Decodes a one pass stream, which holds a single unnamed file
+    #to stdout or to stream.out in the output directory
+    start = time.perf_counter()
+    if args.stdout:
+        outputPath = sys.stdout.buffer
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        outputPath = os.path.join(args.output, "stream.out")
+    with OpenOutput(outputPath) as outfile:
+        counter = CountingWriter(outfile)
+        DecompressStream(infile, counter)
+        counter.flush()
+    seconds = time.perf_counter() - start
+    print(f"stream: {counter.count} bytes, {Throughput(counter.count, seconds):.2f} MB/s", file=report)
+    return 0
+
+def CommandDecompress(args):
+    report = ReportFile(args.stdout)
+    for path in args.dictionary:
+        LoadDictionary(path)
+
+    archive = args.archive
+    spooled = None
+    if archive == STDIO:
+        #Streams are decoded straight from stdin, archives need a seekable copy
+        if sys.stdin.buffer.peek(len(STREAM_MAGIC))[:len(STREAM_MAGIC)] == STREAM_MAGIC:
+            return DecompressStreamTo(sys.stdin.buffer, args, report)
+        spooled = archive = SpoolStdin()
+    try:
+        if IsStream(archive):
+            with open(archive, "rb") as infile:
+                return DecompressStreamTo(infile, args, report)
+
+        if args.stdout:
+            #Every file one after another, text files as UTF-8
+            WriteStdout(sys.stdout.buffer, (chunk for filename, chunk in IterDecompress(archive)))
+            return 0
+
+        #Nothing is previewed, the files are only written out
+        stats = JobStats()
+        Decompress(archive, args.output, previewChars=0, workers=args.workers, dictionaries=args.dictionary, stats=stats)
+        #Sizes read packed -> original and the ratio is the same one compress reports
+        #Older pickled files have no directory, so only their output size is known
+        with ArchiveReader(archive) as reader:
+            legacy = not reader.IsArchive()
+        for fileStats in stats.files:
+            sizes = (f"{fileStats.bytesOut} bytes," if legacy else
+                     f"{fileStats.bytesIn} -> {fileStats.bytesOut} bytes ({Ratio(fileStats.bytesIn, fileStats.bytesOut):.1f}%, {fileStats.method})")
+            print(f"{OutputPath(args.output, fileStats.name)}: {sizes} "
+                  f"{Throughput(fileStats.bytesOut, fileStats.seconds):.2f} MB/s", file=report)
+        print(f"total: {len(stats.files)} files, {stats.bytesIn} -> {stats.bytesOut} bytes ({Ratio(stats.bytesIn, stats.bytesOut):.1f}%) "
+              f"in {stats.seconds:.2f}s, {Throughput(stats.bytesOut, stats.seconds):.2f} MB/s", file=report)
+        return 0
+    finally:
+        if spooled is not None:
+            os.remove(spooled)
+
+def CommandList(args):
+    with open(args.archive, "rb") as infile:
+        if infile.read(len(MAGIC)) != MAGIC and IsStream(args.archive):
+            print("Adaptive stream, it holds a single file and has no directory")
+            return 0
+    print(f"{'size':>12} {'packed':>12} {'ratio':>7} {'method':>8}  name")
+    for entry in List(args.archive):
+        print(f"{entry.originalSize:>12} {entry.byteLength:>12} {Ratio(entry.byteLength, entry.originalSize):>6.1f}% "
+              f"{METHOD_NAMES.get(entry.method, entry.method):>8}  {entry.name}")
+    return 0
+
+def CommandExtract(args):
+    for path in args.dictionary:
+        LoadDictionary(path)
+    if args.dest == STDIO:
+        out = sys.stdout.buffer
+        with ArchiveReader(args.archive) as reader:
+            if reader.IsArchive():
+                #Only the member's own payload is read and decoded
+                chunks = IterEntryChunks(reader, RequireEntry(reader, args.member))
+                WriteStdout(out, chunks)
+                return 0
+        #Older pickled files have no directory, so everything is decoded on the way to the member
+        found = False
+        for filename, chunk in IterDecompress(args.archive):
+            if filename == args.member:
+                found = True
+                WriteStdout(out, (chunk,))
+        if not found:
+            raise KeyError(f"'{args.member}' is not in {args.archive}")
+        return 0
+    print("Extracted", Extract(args.archive, args.member, args.dest))
+    return 0
+
+def CommandVerify(args):
+    #Exits with 1 if anything in the archive is damaged
+    if IsStream(args.archive):
+        print("Adaptive stream, it has no checksums to verify")
+        return 0
+    start = time.perf_counter()
+    results = Verify(args.archive, args.workers, not args.quick, args.dictionary)
+    seconds = time.perf_counter() - start
+    damaged = 0
+    for entry, problems in results:
+        if problems:
+            damaged += 1
+            print(f"{entry.name}: " + "; ".join(problems))
+        elif not entry.HasChecksums() and args.quick:
+            print(f"{entry.name}: not checked (the archive has no checksums)")
+        else:
+            print(f"{entry.name}: ok")
+    print(f"total: {len(results)} files, {damaged} damaged, checked in {seconds:.2f}s")
+    return 1 if damaged else 0
+
+def CommandBench(args):
+    import Benchmark
+    Benchmark.Main(args.options)
+    return 0
+
+def CommandGui(args):
+    import GUI #Importing GUI opens the window and runs it until it is closed
+    return 0
+
+def BuildParser():
+    parser = argparse.ArgumentParser(prog="huffman", description="Huffman coding compression tool")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compress = commands.add_parser("compress", help="compress files into an archive")
+    compress.add_argument("paths", nargs="+", help="files, directories or globs ('-' for stdin)")
+    compress.add_argument("-o", "--output", default=None, help="archive to write ('-' for stdout)")
+    compress.add_argument("-j", "--workers", type=int, default=1, help="worker processes (0 for every CPU)")
+    compress.add_argument("--block-size", type=int, default=None, help="split files into blocks of this many symbols")
+    compress.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="symbols read at a time")
+    compress.add_argument("--backend", choices=BACKENDS, default="auto")
+    compress.add_argument("--mode", choices=MODES, default="text")
+    compress.add_argument("--tables", choices=TABLE_MODES, default="shared")
+    compress.add_argument("--order", type=int, choices=ORDERS, default=0)
+    compress.add_argument("--dictionary", default=None, help="dictionary file to encode with")
+    compress.add_argument("--no-store", action="store_true", help="never store files raw")
+    compress.add_argument("--stats", default=None, help="print the time of each phase and write every number as JSON to this file")
+    compress.set_defaults(func=CommandCompress)
+
+    decompress = commands.add_parser("decompress", help="decompress every file in an archive")
+    decompress.add_argument("archive", help="archive to read ('-' for stdin)")
+    decompress.add_argument("-o", "--output", default="decompressed_files", help="directory to write to")
+    decompress.add_argument("-c", "--stdout", action="store_true", help="write the contents to stdout")
+    decompress.add_argument("-j", "--workers", type=int, default=1, help="worker processes (0 for every CPU)")
+    decompress.add_argument("--dictionary", action="append", default=[], help="dictionary file to load (repeatable)")
+    decompress.set_defaults(func=CommandDecompress)
+
+    listing = commands.add_parser("list", help="list the files in an archive")
+    listing.add_argument("archive")
+    listing.set_defaults(func=CommandList)
+
+    extract = commands.add_parser("extract", help="extract one file from an archive")
+    extract.add_argument("archive")
+    extract.add_argument("member")
+    extract.add_argument("dest", nargs="?", default=None, help="file or directory to write to ('-' for stdout)")
+    extract.add_argument("--dictionary", action="append", default=[], help="dictionary file to load (repeatable)")
+    extract.set_defaults(func=CommandExtract)
+
+    verify = commands.add_parser("verify", help="check an archive for damage without writing anything")
+    verify.add_argument("archive")
+    verify.add_argument("--quick", action="store_true", help="only check the structure and checksums, do not decode")
+    verify.add_argument("-j", "--workers", type=int, default=1, help="worker processes (0 for every CPU)")
+    verify.add_argument("--dictionary", action="append", default=[], help="dictionary file to load (repeatable)")
+    verify.set_defaults(func=CommandVerify)
+
+    bench = commands.add_parser("bench", help="run the benchmarks (see python Benchmark.py --help for the options)")
+    bench.set_defaults(func=CommandBench)
+
+    gui = commands.add_parser("gui", help="open the graphical interface")
+    gui.set_defaults(func=CommandGui)
+    return parser
+
+def Main(argv=None):
+    #Runs the command line and returns the exit code
+    parser = BuildParser()
+    args, extra = parser.parse_known_args(argv)
+    #Options after bench are the benchmark's own
+    if extra and args.command != "bench":
+        parser.error("unrecognized arguments: " + " ".join(extra))
+    args.options = extra
+    if args.command == "compress":
+        if args.output is None:
+            args.output = STDIO if args.paths == [STDIO] else "compressed.bin"
+        if args.workers == 0:
+            args.workers = None
+    if args.command in ("decompress", "verify") and args.workers == 0:
+        args.workers = None
+    try:
+        return args.func(args)
+    except (OSError, ValueError, KeyError) as e:
+        #KeyError would otherwise print its message in quotes
+        message = e.args[0] if isinstance(e, KeyError) and e.args else e
+        print(f"error: {message}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(Main())
@@ -0,0 +1,76 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+#Cache of things built from code tables
+#Building an encoder, a decode lookup table or a display tree from a code table
+#costs far more than looking one up, and a long running process tends to see
+#the same tables again and again (the same dictionary, similar archives)
+#so the results are kept in a bounded LRU cache keyed by a fingerprint of the table
+#The cache is shared by every thread (HuffmanAsync.py jobs, the GUI's worker and its
+#tree window) so it is only touched while holding its lock, but tables are built
+#outside the lock and two threads missing at once may both build the same one
+
+TABLE_CACHE_SIZE = 64 #Number of built tables kept
+
+def TableKey(table):
+    #Returns a fingerprint of a code table, either {symbol: code length} or {symbol: code}
+    #Canonical code tables only depend on their lengths so those can be keyed by the lengths
+    return hashlib.blake2b(repr(sorted(table.items())).encode("utf-8"), digest_size=16).digest()
+
+class TableCache:
+    #This class is a bounded LRU cache of things built from code tables
+    #Each cache has
+        #maxSize -> how many built tables are kept, the least recently used are dropped first
+        #entries -> (kind, table fingerprint) to the built table, least recently used first
+        #hits -> the number of lookups that found a built table
+        #misses -> the number of lookups that had to build one
+        #lock -> held while entries is looked at or changed
+    def __init__(self, maxSize=TABLE_CACHE_SIZE):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def Get(self, kind, table, build):
+        #Returns what build() makes from table, only calling it if it is not cached
+        #kind keeps different things built from the same table apart ("decode", "tree", ...)
+        key = (kind, TableKey(table))
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+        value = build()
+        with self.lock:
+            if self.maxSize > 0:
+                self.entries[key] = value
+                self.Trim()
+        return value
+
+    def Trim(self):
+        with self.lock:
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def Resize(self, maxSize):
+        #Changes how many built tables are kept (0 turns the cache off)
+        with self.lock:
+            self.maxSize = maxSize
+            self.Trim()
+
+    def Clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def Stats(self):
+        #Returns (hits, misses, number of cached tables)
+        with self.lock:
+            return self.hits, self.misses, len(self.entries)
+
+#The cache shared by Compress, Decompress and the tree viewer
+tableCache = TableCache()
@@ -0,0 +1,216 @@
+#Table driven Huffman decoder
+#Instead of walking the encoded bits one at a time and probing a dictionary
+#after every bit, we build a lookup table indexed by the next few bits of input
+#Each entry holds every character that fits completely inside that window
+#so a single lookup can emit several characters at once
+#Code tables with byte values (0 to 255) as symbols decode to bytes instead of text
+#Order-1 data switches tables after every character so it is decoded one character per lookup
+
+DEFAULT_TABLE_BITS = 12     #Width of the lookup window (4096 entries)
+OUTPUT_BUFFER_SIZE = 65536  #Number of table hits buffered before they are joined
+READ_SIZE = 1 << 16         #Number of bytes pulled from the input at a time
+
+class DecodeTable:
+    #This class holds the lookup tables built from a code table
+    #Each table has
+        #bits -> the width of the lookup window
+        #multi -> window value to (decoded text, bits used) for every code that fits in the window
+        #         (None when built with multi=False)
+        #single -> window value to (char, code length) for the first code in the window
+        #longCodes -> (code length, code value) to char for codes longer than the window
+        #maxLength -> the length of the longest code
+        #empty -> "" for text tables and b"" for byte tables
+    def __init__(self, codeTable, tableBits=DEFAULT_TABLE_BITS, multi=True):
+        self.bits = tableBits
+        self.empty = b"" if any(isinstance(symbol, int) for symbol in codeTable) else ""
+        self.maxLength = max((len(code) for code in codeTable.values()), default=0)
+        self.single = [(None, 0)] * (1 << tableBits)
+        self.longCodes = {}
+
+        for char, code in codeTable.items():
+            if isinstance(char, int):
+                char = bytes((char,))
+            length = len(code)
+            value = int(code, 2)
+            if length <= tableBits:
+                #Every window starting with this code decodes to this char
+                shift = tableBits - length
+                start = value << shift
+                self.single[start:start + (1 << shift)] = [(char, length)] * (1 << shift)
+            else:
+                self.longCodes[(length, value)] = char
+        self.longLengths = sorted({length for length, value in self.longCodes})
+
+        self.multi = self.BuildMultiTable() if multi else None
+
+    def BuildMultiTable(self):
+        #Builds the multi-symbol table one window width at a time
+        #A window of w bits decodes to its first char followed by whatever
+        #the remaining (w - length) bits decode to, which we already know
+        tableBits = self.bits
+        single = self.single
+        empty = self.empty
+        previous = [[(empty, 0)]]
+        for width in range(1, tableBits + 1):
+            current = []
+            for value in range(1 << width):
+                char, length = single[value << (tableBits - width)]
+                if char is None or length > width:
+                    current.append((empty, 0))
+                else:
+                    restWidth = width - length
+                    text, used = previous[restWidth][value & ((1 << restWidth) - 1)]
+                    current.append((char + text, length + used))
+            previous.append(current)
+        return previous[tableBits]
+
+    def DecodeLong(self, acc, accBits, remaining):
+        #Slow path for codes that do not fit in the lookup window
+        #acc holds accBits unread bits, the next code starts at its top bit
+        for length in self.longLengths:
+            if length > remaining or length > accBits:
+                break
+            char = self.longCodes.get((length, (acc >> (accBits - length)) & ((1 << length) - 1)))
+            if char is not None:
+                return char, length
+        raise ValueError("Invalid Huffman code in encoded data")
+
+def IterDecodeStream(read, bitLength, table, bufferSize=OUTPUT_BUFFER_SIZE):
+    #This decodes bitLength bits of packed (big endian) data
+    #and yields the decoded text in pieces
+    #read(n) is called to get up to n more bytes of input
+    #Decoded text goes into a fixed size buffer which is joined each time it fills up
+    tableBits = table.bits
+    mask = (1 << tableBits) - 1
+    multi = table.multi
+    single = table.single
+    need = max(tableBits, table.maxLength)
+    refillBytes = need // 8 + 8
+
+    empty = table.empty
+    buffer = [empty] * bufferSize
+    count = 0
+    acc = 0          #Bit accumulator, the unread bits are the low accBits bits
+    accBits = 0
+    block = b""      #Input bytes that have been read but not used yet
+    blockPos = 0
+    remaining = bitLength
+
+    while remaining > 0:
+        if accBits < need:
+            if blockPos + refillBytes > len(block):
+                block = block[blockPos:] + read(READ_SIZE)
+                blockPos = 0
+            chunk = block[blockPos:blockPos + refillBytes]
+            blockPos += len(chunk)
+            acc = ((acc & ((1 << accBits) - 1)) << (8 * len(chunk))) | int.from_bytes(chunk, "big")
+            accBits += 8 * len(chunk)
+            if accBits < remaining and not chunk:
+                raise ValueError("Encoded data is shorter than its bit length")
+
+        if accBits >= tableBits:
+            window = (acc >> (accBits - tableBits)) & mask
+        else:
+            window = (acc << (tableBits - accBits)) & mask
+
+        if remaining >= tableBits:
+            #The whole window is real data so we can emit every char in it
+            text, used = multi[window]
+            if not used:
+                text, used = table.DecodeLong(acc, accBits, remaining)
+        else:
+            #The tail of the window is padding, only take one char at a time
+            text, used = single[window]
+            if text is None or used > remaining:
+                text, used = table.DecodeLong(acc, accBits, remaining)
+
+        accBits -= used
+        remaining -= used
+        buffer[count] = text
+        count += 1
+        if count == bufferSize:
+            yield empty.join(buffer)
+            count = 0
+
+    if count:
+        yield empty.join(buffer[:count])
+
+def IterDecodeContextStream(read, bitLength, fallback, contexts, bufferSize=OUTPUT_BUFFER_SIZE):
+    #Same as IterDecodeStream for data encoded with an order-1 model
+    #Each character is decoded with the table of the character before it
+    #contexts maps a decoded character to its DecodeTable, any character
+    #not in it (and the first character) uses the fallback table
+    #Every table must have the same window width
+    tableBits = fallback.bits
+    mask = (1 << tableBits) - 1
+    need = max([tableBits, fallback.maxLength] + [table.maxLength for table in contexts.values()])
+    refillBytes = need // 8 + 8
+
+    empty = fallback.empty
+    buffer = [empty] * bufferSize
+    count = 0
+    acc = 0
+    accBits = 0
+    block = b""
+    blockPos = 0
+    remaining = bitLength
+    table = fallback
+
+    while remaining > 0:
+        if accBits < need:
+            if blockPos + refillBytes > len(block):
+                block = block[blockPos:] + read(READ_SIZE)
+                blockPos = 0
+            chunk = block[blockPos:blockPos + refillBytes]
+            blockPos += len(chunk)
+            acc = ((acc & ((1 << accBits) - 1)) << (8 * len(chunk))) | int.from_bytes(chunk, "big")
+            accBits += 8 * len(chunk)
+            if accBits < remaining and not chunk:
+                raise ValueError("Encoded data is shorter than its bit length")
+
+        if accBits >= tableBits:
+            window = (acc >> (accBits - tableBits)) & mask
+        else:
+            window = (acc << (tableBits - accBits)) & mask
+
+        char, used = table.single[window]
+        if char is None or used > remaining:
+            char, used = table.DecodeLong(acc, accBits, remaining)
+
+        accBits -= used
+        remaining -= used
+        buffer[count] = char
+        count += 1
+        if count == bufferSize:
+            yield empty.join(buffer)
+            count = 0
+        table = contexts.get(char, fallback)
+
+    if count:
+        yield empty.join(buffer[:count])
+
+def SliceReader(data):
+    #Returns a read(n) function over a bytes-like object
+    pos = 0
+    def Read(size):
+        nonlocal pos
+        chunk = data[pos:pos + size]
+        pos += len(chunk)
+        return chunk
+    return Read
+
+def IterDecodeBits(data, bitLength, table):
+    #Decodes packed data held in memory and yields the text in pieces
+    return IterDecodeStream(SliceReader(data), bitLength, table)
+
+def DecodeBits(data, bitLength, table):
+    #Decodes packed data and returns the text as one string (or bytes)
+    return table.empty.join(IterDecodeBits(data, bitLength, table))
+
+def IterDecodeContextBits(data, bitLength, fallback, contexts):
+    #Decodes order-1 data held in memory and yields the text in pieces
+    return IterDecodeContextStream(SliceReader(data), bitLength, fallback, contexts)
+
+def DecodeContextBits(data, bitLength, fallback, contexts):
+    #Decodes order-1 data and returns the text as one string (or bytes)
+    return fallback.empty.join(IterDecodeContextBits(data, bitLength, fallback, contexts))
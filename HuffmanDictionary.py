@@ -0,0 +1,126 @@
+import hashlib
+import os
+import struct
+import threading
+from collections import OrderedDict
+from HuffmanArchive import PackTable, ReadTable, ReadExact
+
+#Preset code tables (dictionaries) shared between many archives
+#A dictionary is trained once from sample files and saved on its own,
+#archives made with it only store its ID instead of a whole code table
+#The layout of a dictionary file is
+    #Header -> magic, version and the dictionary ID
+    #Table  -> the code lengths, written the same way as an archive table
+#The ID is a hash of the table so the same table always gets the same ID
+#and a dictionary that has been changed will not match archives made with the old one
+#Loaded dictionaries are kept in an LRU cache, their decode tables go in the
+#table cache (see HuffmanCache.py) like any other table
+
+DICTIONARY_MAGIC = b"HUFD"
+DICTIONARY_VERSION = 1
+DICTIONARY_EXTENSION = ".hufd"
+DICTIONARY_CACHE_SIZE = 16 #Number of dictionaries kept loaded
+ID_SIZE = 8
+
+DICTIONARY_HEADER = struct.Struct(f">4sB{ID_SIZE}s")   #magic, version, ID
+
+def DictionaryId(codeLengths):
+    #Returns the ID of a code table, a hash of its packed form
+    return hashlib.blake2b(PackTable(codeLengths), digest_size=ID_SIZE).digest()
+
+class Dictionary:
+    #This class holds a loaded dictionary
+    #Each dictionary has
+        #id -> the ID archives refer to it by (bytes)
+        #codeLengths -> {symbol: code length}
+        #path -> the file it was loaded from
+    def __init__(self, dictionaryId, codeLengths, path=None):
+        self.id = dictionaryId
+        self.codeLengths = codeLengths
+        self.path = path
+
+    def Name(self):
+        #The ID as hex, which is how it is shown to users
+        return self.id.hex()
+
+def SaveDictionary(path, codeLengths):
+    #Writes codeLengths to a dictionary file and returns its Dictionary
+    dictionary = Dictionary(DictionaryId(codeLengths), codeLengths, path)
+    with open(path, "wb") as outfile:
+        outfile.write(DICTIONARY_HEADER.pack(DICTIONARY_MAGIC, DICTIONARY_VERSION, dictionary.id))
+        outfile.write(PackTable(codeLengths))
+    return dictionary
+
+def ReadDictionary(path):
+    #Reads a dictionary file and returns its Dictionary
+    with open(path, "rb") as infile:
+        magic, version, dictionaryId = DICTIONARY_HEADER.unpack(ReadExact(infile, DICTIONARY_HEADER.size))
+        if magic != DICTIONARY_MAGIC:
+            raise ValueError(f"{path} is not a Huffman dictionary")
+        if version != DICTIONARY_VERSION:
+            raise ValueError(f"Unsupported dictionary version {version}")
+        codeLengths = ReadTable(infile)
+    if not isinstance(codeLengths, dict) or DictionaryId(codeLengths) != dictionaryId:
+        raise ValueError(f"Dictionary {path} is corrupt")
+    return Dictionary(dictionaryId, codeLengths, path)
+
+class DictionaryCache:
+    #This class keeps the most recently used dictionaries loaded
+    #Each cache has
+        #maxSize -> how many dictionaries are kept loaded at once
+        #entries -> ID to Dictionary, least recently used first
+        #paths -> ID to the file it came from, kept after a dictionary is dropped so it can be loaded again
+        #loaded -> path to (modified time, ID) so loading the same file again does not read it
+        #lock -> held while any of the above is looked at or changed, the cache is shared by every thread
+    def __init__(self, maxSize=DICTIONARY_CACHE_SIZE):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.paths = {}
+        self.loaded = {}
+        self.lock = threading.RLock()
+
+    def Add(self, dictionary):
+        with self.lock:
+            self.entries[dictionary.id] = dictionary
+            self.entries.move_to_end(dictionary.id)
+            if dictionary.path is not None:
+                self.paths[dictionary.id] = dictionary.path
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+            return dictionary
+
+    def Load(self, path):
+        #Returns the Dictionary in a file, reading it only if it is not already loaded
+        path = os.path.abspath(path)
+        modified = os.path.getmtime(path)
+        with self.lock:
+            known = self.loaded.get(path)
+            if known is not None and known[0] == modified and known[1] in self.entries:
+                self.entries.move_to_end(known[1])
+                return self.entries[known[1]]
+            dictionary = ReadDictionary(path)
+            self.loaded[path] = (modified, dictionary.id)
+            return self.Add(dictionary)
+
+    def Find(self, dictionaryId):
+        #Returns the Dictionary with an ID, reloading it from its file if it was dropped
+        #Raises KeyError if the dictionary was never loaded
+        with self.lock:
+            if dictionaryId in self.entries:
+                self.entries.move_to_end(dictionaryId)
+                return self.entries[dictionaryId]
+            if dictionaryId in self.paths:
+                dictionary = self.Load(self.paths[dictionaryId])
+                if dictionary.id == dictionaryId:
+                    return dictionary
+        raise KeyError(f"Dictionary {dictionaryId.hex()} is not loaded, load it with LoadDictionary first")
+
+#The cache used by Compress and Decompress
+dictionaryCache = DictionaryCache()
+
+def LoadDictionary(path):
+    #Loads a dictionary file so archives that refer to it can be read
+    return dictionaryCache.Load(path)
+
+def FindDictionary(dictionaryId):
+    return dictionaryCache.Find(dictionaryId)
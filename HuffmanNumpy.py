@@ -0,0 +1,113 @@
+from bitarray import bitarray
+
+#Optional NumPy backend for counting and encoding
+#Text is turned into an array of code points so counting is a single np.bincount
+#and encoding gathers every character's code and length from lookup arrays
+#then packs the codes into 64 bit words all at once
+#Everything here needs NumPy, check Available() before using it
+#NumPy is only imported once something here is used, so importing this module
+#(and everything that imports it, like the command line) does not load it
+
+np = None   #The numpy module once LoadNumpy has imported it
+
+def LoadNumpy():
+    #Imports NumPy the first time it is needed, raises ImportError if it is not installed
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+def Available():
+    try:
+        LoadNumpy()
+    except ImportError:
+        return False
+    return True
+
+def CodePoints(text):
+    #Returns the symbols of text as an array, code points for a string
+    #and byte values for anything bytes-like
+    if isinstance(text, str):
+        return np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype="<u4")
+    return np.frombuffer(text, dtype=np.uint8)
+
+def CountFrequencyNumpy(text, freq=None):
+    #Same as Huffman.CountFrequency but counts with np.bincount
+    LoadNumpy()
+    if freq is None:
+        freq = {}
+    if not text:
+        return freq
+    counts = np.bincount(CodePoints(text))
+    present = np.flatnonzero(counts)
+    for codePoint, count in zip(present.tolist(), counts[present].tolist()):
+        char = chr(codePoint)
+        freq[char] = freq.get(char, 0) + count
+    return freq
+
+def CountBytesNumpy(data, freq=None):
+    #Same as Huffman.CountBytes but counts with np.bincount
+    LoadNumpy()
+    if freq is None:
+        freq = {}
+    counts = np.bincount(CodePoints(data), minlength=256)
+    present = np.flatnonzero(counts)
+    for byte, count in zip(present.tolist(), counts[present].tolist()):
+        freq[byte] = freq.get(byte, 0) + count
+    return freq
+
+def SymbolIndex(symbol):
+    #Characters are indexed by code point and bytes by their value
+    return ord(symbol) if isinstance(symbol, str) else symbol
+
+class NumpyEncoder:
+    #This class encodes text (or bytes) with a code table using NumPy arrays
+    #Each encoder has
+        #codes -> code point (or byte value) to the integer value of its code
+        #lengths -> code point (or byte value) to the length of its code (0 if the symbol has no code)
+    def __init__(self, codeTable):
+        LoadNumpy()
+        size = max(SymbolIndex(symbol) for symbol in codeTable) + 1
+        self.codes = np.zeros(size, dtype=np.uint64)
+        self.lengths = np.zeros(size, dtype=np.int64)
+        for symbol, code in codeTable.items():
+            self.codes[SymbolIndex(symbol)] = int(code, 2)
+            self.lengths[SymbolIndex(symbol)] = len(code)
+        if self.lengths.max() > 64:
+            raise ValueError("Codes longer than 64 bits are not supported by the NumPy backend")
+
+    def __call__(self, text):
+        #Encodes text and returns the bits as a bitarray
+        encodedBits = bitarray()
+        if not len(text):
+            return encodedBits
+        codePoints = CodePoints(text)
+        if codePoints.max() >= len(self.lengths):
+            raise KeyError("Character is not in the code table")
+        lengths = self.lengths[codePoints]
+        if not lengths.all():
+            raise KeyError("Character is not in the code table")
+        codes = self.codes[codePoints]
+
+        #Every code lands in one 64 bit word, or spills over into the next one
+        #Codes never overlap so adding up the pieces of each word is the same as OR-ing them
+        ends = np.cumsum(lengths)
+        bitLength = int(ends[-1])
+        starts = ends - lengths
+        words = starts >> 6
+        endInWord = (starts & 63) + lengths
+        left = 64 - endInWord
+        first = np.where(left >= 0,
+                         codes << np.clip(left, 0, 63).astype(np.uint64),
+                         codes >> np.clip(-left, 0, 63).astype(np.uint64))
+
+        packed = np.zeros(bitLength // 64 + 2, dtype=np.uint64)
+        segmentStarts = np.flatnonzero(np.diff(words, prepend=-1))
+        packed[words[segmentStarts]] = np.add.reduceat(first, segmentStarts)
+        spills = np.flatnonzero(left < 0)
+        packed[words[spills] + 1] += codes[spills] << (64 + left[spills]).astype(np.uint64)
+
+        encodedBits.frombytes(packed.astype(">u8").tobytes()[:(bitLength + 7) // 8])
+        del encodedBits[bitLength:]
+        return encodedBits
@@ -0,0 +1,228 @@
+import threading
+import time
+
+#Statistics of a Compress or Decompress run
+#Pass a JobStats as stats= to see where the time of a job went: each phase
+#(reading, counting, building tables, encoding, writing, ...) is timed on its own,
+#and the bytes, symbols and time of every file are kept as well
+#A callback given to JobStats is called as callback(event, values, stats) when
+    #"phase" -> a step of the job finished, values holds its name and the seconds spent in it so far
+    #"file"  -> a file finished, values holds its FileStats as "file"
+    #"done"  -> the job finished, values is empty
+#so the numbers can go to a log or a metrics exporter while the job runs
+#Jobs run without stats get NULL_STATS, whose methods do nothing, so timing
+#costs nothing unless it was asked for
+#Phases are timed a chunk at a time, never a symbol at a time
+#Jobs run in a background thread (by the GUI or HuffmanAsync.py) use ControlledStats,
+#which can stop the job from another thread and also reports
+    #"chunk" -> a chunk was read or decoded, values holds the phase and the chunk size
+
+class FileStats:
+    #This class holds the numbers of one file of a job
+    #Each file has
+        #name -> the filename
+        #method -> how it was stored ("huffman", "stored" or "order1")
+        #bytesIn -> bytes read for this file (the original file or its payload)
+        #bytesOut -> bytes written for this file (its payload or the decompressed file)
+        #symbols -> the number of characters (or bytes) in the file
+        #seconds -> how long the file took, from the end of the previous file or step of the job
+    def __init__(self, name, method=None, bytesIn=0, bytesOut=0, symbols=0, seconds=0.0):
+        self.name = name
+        self.method = method
+        self.bytesIn = bytesIn
+        self.bytesOut = bytesOut
+        self.symbols = symbols
+        self.seconds = seconds
+
+    def AsDict(self):
+        return dict(vars(self))
+
+class JobStats:
+    #This class collects the numbers of one Compress or Decompress run
+    #Each job has
+        #operation -> "compress" or "decompress"
+        #phases -> phase name to total seconds spent in it
+        #bytesIn -> bytes read (all input files, or the archive)
+        #bytesOut -> bytes written (the archive, or all output files)
+        #symbols -> characters (or bytes) coded
+        #tables -> the number of symbols in each code table
+        #codeTables -> each {symbol: code length} table itself, for displays (left out of AsDict)
+        #tableBytes -> bytes the archive header and code tables take up
+        #files -> FileStats of every file, in archive order
+        #seconds -> wall time of the whole job
+        #callback -> called on every event (see the top of this file), or None
+    enabled = True
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.Reset()
+
+    def Reset(self):
+        self.operation = None
+        self.phases = {}
+        self.bytesIn = 0
+        self.bytesOut = 0
+        self.symbols = 0
+        self.tables = []
+        self.codeTables = []
+        self.tableBytes = 0
+        self.files = []
+        self.seconds = 0.0
+        self.started = None
+        self.lastFile = None
+
+    def Start(self, operation):
+        #Called by Compress and Decompress, clears anything left from an earlier job
+        self.Reset()
+        self.operation = operation
+        self.started = self.lastFile = time.perf_counter()
+
+    def Emit(self, event, **values):
+        if self.callback is not None:
+            self.callback(event, values, self)
+
+    def AddTime(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def Phase(self, name):
+        #Returns a context manager that adds the time spent inside it to phase name
+        return PhaseTimer(self, name)
+
+    def PhaseDone(self, name):
+        #Tells the callback a step of the job is over, the next file is timed from here
+        self.lastFile = time.perf_counter()
+        self.Emit("phase", name=name, seconds=self.phases.get(name, 0.0))
+
+    def TimeIter(self, phase, items):
+        #Yields items, adding the time spent producing each one to phase
+        items = iter(items)
+        while True:
+            start = time.perf_counter()
+            item = next(items, StopIteration)
+            self.AddTime(phase, time.perf_counter() - start)
+            if item is StopIteration:
+                return
+            yield item
+
+    def AddFile(self, name, method=None, bytesIn=0, bytesOut=0, symbols=0):
+        #Records a finished file, timed from the end of the previous file or step
+        now = time.perf_counter()
+        fileStats = FileStats(name, method, bytesIn, bytesOut, symbols, now - self.lastFile)
+        self.lastFile = now
+        self.files.append(fileStats)
+        self.Emit("file", file=fileStats)
+        return fileStats
+
+    def Finish(self):
+        self.seconds = time.perf_counter() - self.started
+        self.Emit("done")
+
+    def AsDict(self):
+        #Returns the numbers as plain dictionaries and lists (ready for json.dump)
+        return {
+            "operation": self.operation,
+            "seconds": self.seconds,
+            "phases": dict(self.phases),
+            "bytesIn": self.bytesIn,
+            "bytesOut": self.bytesOut,
+            "symbols": self.symbols,
+            "tables": list(self.tables),
+            "tableBytes": self.tableBytes,
+            "files": [fileStats.AsDict() for fileStats in self.files],
+        }
+
+    def Report(self):
+        #Returns a short human readable summary
+        lines = [f"{self.operation}: {self.bytesIn} bytes in, {self.bytesOut} bytes out, "
+                 f"{self.symbols} symbols in {self.seconds:.3f}s"]
+        for phase, seconds in self.phases.items():
+            lines.append(f"  {phase:<10}{seconds:9.3f}s")
+        if self.tables:
+            lines.append(f"  {len(self.tables)} code tables with {sum(self.tables)} symbols in {self.tableBytes} bytes")
+        return "\n".join(lines)
+
+class JobCancelled(Exception):
+    #Raised inside a job to unwind it once ControlledStats.Cancel has been called
+    pass
+
+class ControlledStats(JobStats):
+    #This class is the JobStats of a job running in a background thread
+    #Each one also has
+        #cancelled -> set by Cancel from any thread, the job stops at its next chunk or file
+    #The callback is called on the job's thread
+    def __init__(self, callback=None):
+        JobStats.__init__(self, callback)
+        self.cancelled = threading.Event()
+
+    def Cancel(self):
+        self.cancelled.set()
+
+    def Emit(self, event, **values):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+        JobStats.Emit(self, event, **values)
+
+    def TimeIter(self, phase, items):
+        for item in JobStats.TimeIter(self, phase, items):
+            self.Emit("chunk", phase=phase, size=len(item))
+            yield item
+
+class PhaseTimer:
+    #This class is the context manager JobStats.Phase returns
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.AddTime(self.name, time.perf_counter() - self.start)
+        return False
+
+class NullStats:
+    #Stands in for JobStats when no statistics were asked for, every method does nothing
+    enabled = False
+
+    def Start(self, operation):
+        pass
+
+    def AddTime(self, phase, seconds):
+        pass
+
+    def Phase(self, name):
+        return NULL_PHASE
+
+    def PhaseDone(self, name):
+        pass
+
+    def TimeIter(self, phase, items):
+        return items
+
+    def AddFile(self, name, method=None, bytesIn=0, bytesOut=0, symbols=0):
+        pass
+
+    def Finish(self):
+        pass
+
+class NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_PHASE = NullPhase()
+NULL_STATS = NullStats()
+
+def ResolveStats(stats):
+    #None means no statistics, a function is taken as the callback of a new JobStats
+    if stats is None:
+        return NULL_STATS
+    if isinstance(stats, JobStats):
+        return stats
+    if callable(stats):
+        return JobStats(stats)
+    raise ValueError("stats must be a JobStats, a callback or None")
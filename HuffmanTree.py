@@ -0,0 +1,145 @@
+from array import array
+
+#Flat Huffman trees
+#A tree of HuffmanNode objects costs a Python object per node and a Python level
+#comparison for every heap operation, which adds up for large alphabets
+#Here the nodes are positions in parallel arrays (left child, right child, weight)
+#plus a list of symbols, and nothing is ever recursive so deep trees are fine
+#Ties are broken the same way everywhere: symbols are ordered by (count, symbol)
+#and when a symbol and a merged node weigh the same the symbol is taken first,
+#which is also what BuildCodeLengths does, so both give the same code lengths
+
+NO_NODE = -1
+
+class HuffmanTree:
+    #This class is a Huffman tree stored as parallel arrays
+    #Each tree has
+        #left, right -> the child reached by a 0 and by a 1 (NO_NODE if there is none)
+        #weight -> the count of a node (number of symbols below it for trees rebuilt from codes)
+        #symbol -> the symbol of a leaf (None for inner nodes)
+        #root -> the index of the root (NO_NODE for an empty tree)
+    def __init__(self):
+        self.left = array("i")
+        self.right = array("i")
+        self.weight = array("q")
+        self.symbol = []
+        self.root = NO_NODE
+
+    def __len__(self):
+        return len(self.symbol)
+
+    def AddNode(self, weight=0, symbol=None, left=NO_NODE, right=NO_NODE):
+        self.left.append(left)
+        self.right.append(right)
+        self.weight.append(weight)
+        self.symbol.append(symbol)
+        return len(self.symbol) - 1
+
+    def IsLeaf(self, node):
+        return self.left[node] == NO_NODE and self.right[node] == NO_NODE
+
+    def Children(self, node):
+        return [child for child in (self.left[node], self.right[node]) if child != NO_NODE]
+
+    def BranchChildren(self, node):
+        #Returns (bit, child) for each child of a node
+        return [(bit, child) for bit, child in (("0", self.left[node]), ("1", self.right[node])) if child != NO_NODE]
+
+    def Walk(self):
+        #Yields (node, depth) for every node, parents before their children, left before right
+        if self.root == NO_NODE:
+            return
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            yield node, depth
+            if self.right[node] != NO_NODE:
+                stack.append((self.right[node], depth + 1))
+            if self.left[node] != NO_NODE:
+                stack.append((self.left[node], depth + 1))
+
+    def Depths(self):
+        #Returns the depth of every node
+        depths = array("i", [0]) * len(self)
+        for node, depth in self.Walk():
+            depths[node] = depth
+        return depths
+
+    def Leaves(self):
+        #Returns how many symbols are below every node (1 for a leaf)
+        leaves = array("q", [0]) * len(self)
+        for node, depth in reversed(list(self.Walk())):
+            if self.IsLeaf(node):
+                leaves[node] = 1
+            else:
+                leaves[node] = sum(leaves[child] for child in self.Children(node))
+        return leaves
+
+    def CodeLengths(self):
+        #Returns {symbol: code length}, a tree of one symbol still gives it a 1 bit code
+        return {self.symbol[node]: max(depth, 1) for node, depth in self.Walk() if self.IsLeaf(node)}
+
+    def Codes(self):
+        #Returns {symbol: code} with 0 for left and 1 for right
+        if self.root == NO_NODE:
+            return {}
+        if self.IsLeaf(self.root):
+            return {self.symbol[self.root]: "0"}
+        codes = {}
+        stack = [(self.root, "")]
+        while stack:
+            node, prefix = stack.pop()
+            if self.IsLeaf(node):
+                codes[self.symbol[node]] = prefix
+                continue
+            for bit, child in self.BranchChildren(node):
+                stack.append((child, prefix + bit))
+        return codes
+
+def BuildTree(frequency):
+    #Builds the Huffman tree of {symbol: count} as a HuffmanTree
+    #Once the symbols are sorted the merged nodes come out in order of weight,
+    #so two queues (unmerged symbols and merged nodes) replace the heap
+    #and every step just compares the fronts of the two
+    tree = HuffmanTree()
+    for symbol in sorted(frequency, key=lambda symbol: (frequency[symbol], symbol)):
+        tree.AddNode(frequency[symbol], symbol)
+    symbolCount = len(tree)
+    if symbolCount == 0:
+        return tree
+
+    weight = tree.weight
+    nextLeaf = 0
+    nextMerged = symbolCount
+    for _ in range(symbolCount - 1):
+        children = []
+        for _ in range(2):
+            if nextMerged < len(tree) and (nextLeaf >= symbolCount or weight[nextMerged] < weight[nextLeaf]):
+                children.append(nextMerged)
+                nextMerged += 1
+            else:
+                children.append(nextLeaf)
+                nextLeaf += 1
+        tree.AddNode(weight[children[0]] + weight[children[1]], None, children[0], children[1])
+    tree.root = len(tree) - 1
+    return tree
+
+def TreeFromCodes(codeTable):
+    #Rebuilds the tree of a code table ({symbol: code}) one code at a time
+    #Node weights are the number of symbols below each node
+    tree = HuffmanTree()
+    if not codeTable:
+        return tree
+    tree.root = tree.AddNode()
+    left = tree.left
+    right = tree.right
+    for symbol, code in codeTable.items():
+        node = tree.root
+        for bit in code:
+            children = left if bit == "0" else right
+            if children[node] == NO_NODE:
+                children[node] = tree.AddNode()
+            node = children[node]
+        tree.symbol[node] = symbol
+    tree.weight = tree.Leaves()
+    return tree
@@ -1,8 +1,9 @@
 import sys
 import os
 import shutil
-import pickle
-from Huffman import Compress, Decompress, GetFileSize
+from Huffman import Compress, Decompress, GetFileSize, LoadCodeTable, List, Extract, Verify, TrainDictionary
+from HuffmanArchive import METHOD_HUFFMAN, METHOD_ORDER1
+from AdaptiveHuffman import CompressStream, DecompressStream
 
 def TestSingleFile(fileName):
     print("==============================================")
@@ -84,6 +85,221 @@ def TestMultipleFiles(fileNames):
     print("Total decompressed size: {} bytes".format(totalDecompressedSize))
     print("==============================================\n")
 
+def TestListExtract(fileNames):
+    print("==============================================")
+    print("Testing listing and extracting single files for:", ", ".join(fileNames))
+
+    compressedFile = "multiple_compressed.bin"
+    outputFolder = "decompressed_multiple"
+    Compress(fileNames, compressedFile)
+    os.makedirs(outputFolder, exist_ok=True)
+
+    #The directory should list every file with its original size
+    entries = {entry.name: entry for entry in List(compressedFile)}
+    for fileName in fileNames:
+        name = os.path.basename(fileName)
+        entry = entries.get(name)
+        if entry is not None and entry.originalSize == GetFileSize(fileName):
+            print(f"SUCCESS: '{name}' is listed with its size.")
+        else:
+            print(f"ERROR: '{name}' is missing from the listing or has the wrong size.")
+
+        #Extract only this file and compare it to the original
+        extractedFile = Extract(compressedFile, name, outputFolder)
+        with open(fileName, "rb") as fin:
+            originalData = fin.read()
+        with open(extractedFile, "rb") as fin:
+            extractedData = fin.read()
+        if originalData == extractedData:
+            print(f"SUCCESS: '{name}' extracted correctly.")
+        else:
+            print(f"ERROR: '{name}' extracted incorrectly.")
+
+    #Asking for a file that is not there should fail
+    try:
+        Extract(compressedFile, "not_in_the_archive.txt", outputFolder)
+        print("ERROR: Extracting a missing file did not fail.")
+    except KeyError:
+        print("SUCCESS: Extracting a missing file failed.")
+    print("==============================================\n")
+
+def MakeBinaryTestFile(fileName):
+    #Writes a file that is not valid UTF-8 text so byte mode has something to chew on
+    #Every byte value shows up, with a skewed repeating pattern after it
+    data = bytes(range(256)) + bytes((i * i) % 251 for i in range(20000))
+    with open(fileName, "wb") as fout:
+        fout.write(data)
+
+def TestBinaryFile(fileName):
+    print("==============================================")
+    print("Testing binary file compression/decompression for:", fileName)
+
+    compressedFile = fileName + "_compressed.bin"
+    outputFolder = "decompressed_single"
+
+    #Compress the file as raw bytes
+    Compress([fileName], compressedFile, mode="bytes")
+    Decompress(compressedFile, outputFolder)
+
+    decompressedFile = os.path.join(outputFolder, "decompressed_" + os.path.basename(fileName))
+
+    #Compare the bytes of the original and decompressed files
+    with open(fileName, "rb") as fin:
+        originalData = fin.read()
+    with open(decompressedFile, "rb") as fin:
+        decompressedData = fin.read()
+
+    if originalData == decompressedData:
+        print("SUCCESS: Decompressed bytes match original for", fileName)
+    else:
+        print("ERROR: Decompressed bytes do not match original for", fileName)
+
+    print(f"Input file '{fileName}' size: {GetFileSize(fileName)} bytes")
+    print(f"Compressed file '{compressedFile}' size: {GetFileSize(compressedFile)} bytes")
+    print(f"Decompressed file '{decompressedFile}' size: {GetFileSize(decompressedFile)} bytes")
+    print("==============================================\n")
+
+def TestCorruption(fileName):
+    print("==============================================")
+    print("Testing that a damaged archive is caught for:", fileName)
+
+    #Written to the current directory so CleanTestArtifacts removes them
+    compressedFile = os.path.basename(fileName).replace(".txt", "_compressed.bin")
+    damagedFile = os.path.basename(fileName).replace(".txt", "_damaged_compressed.bin")
+    outputFolder = "decompressed_single"
+    Compress([fileName], compressedFile)
+
+    #A good archive should verify without any problems
+    if all(not problems for entry, problems in Verify(compressedFile)):
+        print("SUCCESS: Undamaged archive verified for", fileName)
+    else:
+        print("ERROR: Undamaged archive failed to verify for", fileName)
+
+    #Flip one bit in the middle of the file's payload
+    entry = List(compressedFile)[0]
+    with open(compressedFile, "rb") as fin:
+        data = bytearray(fin.read())
+    data[entry.offset + entry.byteLength // 2] ^= 0x10
+    with open(damagedFile, "wb") as fout:
+        fout.write(data)
+
+    #Verify should name the damaged file and Decompress should refuse it
+    problems = {entry.name: problems for entry, problems in Verify(damagedFile)}
+    if problems.get(entry.name):
+        print("SUCCESS: Verify reported the damage:", "; ".join(problems[entry.name]))
+    else:
+        print("ERROR: Verify did not report the damaged file", entry.name)
+    try:
+        Decompress(damagedFile, outputFolder)
+        print("ERROR: Decompress did not notice the damage for", fileName)
+    except ValueError as e:
+        print("SUCCESS: Decompress stopped at the damage:", e)
+    print("==============================================\n")
+
+def CompareDecompressed(fileNames, outputFolder):
+    #Prints whether every file came back out of outputFolder unchanged
+    for fileName in fileNames:
+        decompressedFile = os.path.join(outputFolder, "decompressed_" + os.path.basename(fileName))
+        with open(fileName, "rb") as fin:
+            originalData = fin.read()
+        with open(decompressedFile, "rb") as fin:
+            decompressedData = fin.read()
+        if originalData == decompressedData:
+            print(f"SUCCESS: '{fileName}' decompressed correctly.")
+        else:
+            print(f"ERROR: '{fileName}' decompressed incorrectly.")
+
+def TestOrder1(fileNames):
+    print("==============================================")
+    print("Testing order-1 compression/decompression for files:", ", ".join(fileNames))
+
+    compressedFile = "order1_compressed.bin"
+    outputFolder = "decompressed_multiple"
+    Compress(fileNames, compressedFile, order=1)
+
+    #Every file that was not stored should use the order-1 model
+    methods = {entry.name: entry.method for entry in List(compressedFile)}
+    if METHOD_ORDER1 in methods.values() and METHOD_HUFFMAN not in methods.values():
+        print("SUCCESS: Files were encoded with the order-1 model.")
+    else:
+        print("ERROR: Files were not encoded with the order-1 model:", methods)
+
+    Decompress(compressedFile, outputFolder)
+    CompareDecompressed(fileNames, outputFolder)
+    print(f"Compressed file '{compressedFile}' size: {GetFileSize(compressedFile)} bytes")
+    print("==============================================\n")
+
+def TestDictionary(fileNames):
+    print("==============================================")
+    print("Testing compression/decompression with a dictionary for files:", ", ".join(fileNames))
+
+    dictionaryFile = "test_dictionary.hufd"
+    compressedFile = "dictionary_compressed.bin"
+    outputFolder = "decompressed_multiple"
+
+    #Train on the files themselves so every symbol has a code in the dictionary
+    TrainDictionary(fileNames, dictionaryFile)
+    Compress(fileNames, compressedFile, dictionary=dictionaryFile)
+
+    #The archive should hold no table of its own, so it is smaller than one that does
+    Compress(fileNames, "multiple_compressed.bin")
+    if GetFileSize(compressedFile) < GetFileSize("multiple_compressed.bin"):
+        print("SUCCESS: The archive using the dictionary is smaller.")
+    else:
+        print("ERROR: The archive using the dictionary is not smaller.")
+
+    Decompress(compressedFile, outputFolder, dictionaries=[dictionaryFile])
+    CompareDecompressed(fileNames, outputFolder)
+    print(f"Dictionary file '{dictionaryFile}' size: {GetFileSize(dictionaryFile)} bytes")
+    print(f"Compressed file '{compressedFile}' size: {GetFileSize(compressedFile)} bytes")
+    print("==============================================\n")
+
+def TestAdaptiveStream(fileName):
+    print("==============================================")
+    print("Testing adaptive stream compression/decompression for:", fileName)
+
+    compressedFile = os.path.basename(fileName).replace(".txt", "_stream_compressed.bin")
+    outputFolder = "decompressed_single"
+    decompressedFile = os.path.join(outputFolder, "decompressed_" + os.path.basename(fileName))
+    os.makedirs(outputFolder, exist_ok=True)
+
+    #Streams are read and written through file objects in one pass
+    with open(fileName, "rb") as fin, open(compressedFile, "wb") as fout:
+        CompressStream(fin, fout)
+    with open(compressedFile, "rb") as fin, open(decompressedFile, "wb") as fout:
+        DecompressStream(fin, fout)
+
+    with open(fileName, "rb") as fin:
+        originalData = fin.read()
+    with open(decompressedFile, "rb") as fin:
+        decompressedData = fin.read()
+    if originalData == decompressedData:
+        print("SUCCESS: Decompressed stream matches original for", fileName)
+    else:
+        print("ERROR: Decompressed stream does not match original for", fileName)
+    print(f"Compressed file '{compressedFile}' size: {GetFileSize(compressedFile)} bytes")
+    print("==============================================\n")
+
+def TestParallelMatchesSerial(fileNames):
+    print("==============================================")
+    print("Testing that parallel compression matches serial for files:", ", ".join(fileNames))
+
+    #Small chunks and blocks so the work is split up between the workers
+    for label, blockSize in (("chunks", None), ("blocks", 1000)):
+        serialFile = f"serial_{label}_compressed.bin"
+        parallelFile = f"parallel_{label}_compressed.bin"
+        Compress(fileNames, serialFile, chunkSize=1000, blockSize=blockSize, workers=1)
+        Compress(fileNames, parallelFile, chunkSize=1000, blockSize=blockSize, workers=2)
+        with open(serialFile, "rb") as fin:
+            serialData = fin.read()
+        with open(parallelFile, "rb") as fin:
+            parallelData = fin.read()
+        if serialData == parallelData:
+            print(f"SUCCESS: Parallel and serial archives are identical ({label}).")
+        else:
+            print(f"ERROR: Parallel and serial archives differ ({label}).")
+    print("==============================================\n")
+
 def TestShowHuffmanTree(fileName):
     print("==============================================")
     print("Testing Huffman Tree display for:", fileName)
@@ -96,13 +312,11 @@ def TestShowHuffmanTree(fileName):
     
     #Load the compressed file to extract the Huffman code table.
     try:
-        with open(compressedFile, "rb") as infile:
-            data = pickle.load(infile)
+        codeTable = LoadCodeTable(compressedFile)
     except Exception as e:
         print("ERROR: Failed to load compressed file:", e)
         return
     
-    codeTable = data.get("t")
     if codeTable is None:
         print("ERROR: No Huffman code table found for", fileName)
         return
@@ -126,7 +340,9 @@ def CleanTestArtifacts():
     filesToRemove = [fileName for fileName in os.listdir() 
                      if fileName.endswith("_compressed.bin") 
                      or fileName.endswith("_tree.bin") 
-                     or fileName == "multiple_compressed.bin"]
+                     or fileName == "multiple_compressed.bin"
+                     or fileName == "binary_test.dat"
+                     or fileName == "test_dictionary.hufd"]
     for fileName in filesToRemove:
         print("Deleting", fileName)
         os.remove(fileName)
@@ -152,6 +368,24 @@ def Main():
     
     #Test all files together.
     TestMultipleFiles(testFiles)
+
+    #Test reading single files back out of an archive.
+    TestListExtract(testFiles)
+
+    #Test byte mode on a file that is not text.
+    MakeBinaryTestFile("binary_test.dat")
+    TestBinaryFile("binary_test.dat")
+
+    #Test that a damaged archive is caught rather than decoded.
+    TestCorruption(testFiles[0])
+
+    #Test the order-1 model, dictionaries and the adaptive stream format.
+    TestOrder1(testFiles)
+    TestDictionary(testFiles)
+    TestAdaptiveStream(testFiles[0])
+
+    #Test that using more workers does not change the archive.
+    TestParallelMatchesSerial(testFiles)
     
     #Test Huffman tree display on one file (e.g., the first file).
     TestShowHuffmanTree(testFiles[0])
@@ -162,6 +396,10 @@ def Main():
 if __name__ == "__main__":
     if "--test" in sys.argv:
         Main()
+    elif len(sys.argv) > 1:
+        #Anything else is a command line command (see HuffmanCLI.py)
+        from HuffmanCLI import Main as RunCommandLine
+        sys.exit(RunCommandLine(sys.argv[1:]))
     else:
         #Run the GUI application.
         import GUI